@@ -2,42 +2,60 @@
 High-performance in-memory caching layer.
 Critical for meeting <500ms recommendation latency.
 """
-from functools import lru_cache
-from typing import Any, Optional, Dict
-from datetime import datetime, timedelta
-import hashlib
-import json
+from typing import Any, Optional, Dict, List, Tuple
+import re
+import sys
+import threading
+import time
+from cachetools import TTLCache as _TTLCache
+import faiss
+import numpy as np
+import orjson
+import xxhash
+import zstandard
+from redis.exceptions import RedisError
+from backend.redis_client import get_redis
 
 
 class TTLCache:
-    """Time-to-live cache with automatic expiration."""
+    """
+    Time-to-live cache with LRU eviction.
+    Thin facade over cachetools.TTLCache, which keeps entries in LRU order
+    and expires them in bulk (oldest first) on every write.
+    """
+    
+    __slots__ = ("ttl_seconds", "max_size", "_cache", "hits", "misses")
     
     def __init__(self, ttl_seconds: int = 3600, max_size: int = 10000):
         self.ttl_seconds = ttl_seconds
         self.max_size = max_size
-        self._cache: Dict[str, tuple[Any, datetime]] = {}
+        self._cache = _TTLCache(maxsize=max_size, ttl=ttl_seconds, timer=time.monotonic)
+        self.hits = 0
+        self.misses = 0
     
     def get(self, key: str) -> Optional[Any]:
         """Get value from cache if not expired."""
-        if key in self._cache:
-            value, expiry = self._cache[key]
-            if datetime.utcnow() < expiry:
-                return value
-            else:
-                # Expired, remove it
-                del self._cache[key]
-        return None
+        # Straight to __getitem__: one link lookup and one expiry compare,
+        # vs. .get() which runs __contains__ (a second of each) first
+        try:
+            value = self._cache[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
     
     def set(self, key: str, value: Any):
         """Set value in cache with TTL."""
-        # Simple LRU eviction if cache is full
-        if len(self._cache) >= self.max_size:
-            # Remove oldest entry
-            oldest_key = next(iter(self._cache))
-            del self._cache[oldest_key]
-        
-        expiry = datetime.utcnow() + timedelta(seconds=self.ttl_seconds)
-        self._cache[key] = (value, expiry)
+        self._cache[key] = value
+    
+    def expire(self) -> int:
+        """
+        Drop all expired entries, returning how many were removed.
+        With a single fixed TTL, expiry order equals insertion order, so
+        this only walks the expired prefix - O(expired), not O(size).
+        """
+        return len(self._cache.expire())
     
     def clear(self):
         """Clear all cache entries."""
@@ -45,51 +63,271 @@ class TTLCache:
     
     def remove(self, key: str):
         """Remove specific key from cache."""
-        if key in self._cache:
-            del self._cache[key]
+        self._cache.pop(key, None)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Size and hit/miss counters, for tuning TTL and max size."""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._cache),
+            'max_size': self.max_size,
+            'ttl_seconds': self.ttl_seconds,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+class _SemanticScope:
+    """Inner-product index over normalized prompt embeddings for one template."""
+    
+    __slots__ = ("index", "keys", "numbers")
+    
+    def __init__(self, dim: int):
+        self.index = faiss.IndexFlatIP(dim)
+        self.keys: List[str] = []  # llm_response_cache key per vector
+        self.numbers: List[Tuple[str, ...]] = []  # numeric tokens per vector
+
+
+class SemanticCache:
+    """
+    Semantic lookup for LLM responses.
+    Maps a prompt to the cache key of an earlier prompt whose embedding is
+    close enough (cosine >= threshold), so paraphrases reuse a completion.
+    Responses stay in llm_response_cache - this only indexes their keys,
+    so TTL and eviction are shared and an expired match is just a miss.
+    """
+    
+    _NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+    
+    def __init__(self, model_name: str = 'all-MiniLM-L6-v2', max_entries: int = 2000):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self._model = None
+        self._model_failed = False
+        self._model_lock = threading.Lock()
+        self._scopes: Dict[str, _SemanticScope] = {}
+    
+    def _get_model(self):
+        """Load the sentence-transformer on first use (None if unavailable)."""
+        if self._model is None and not self._model_failed:
+            with self._model_lock:
+                if self._model is None and not self._model_failed:
+                    try:
+                        # Deferred: only pay the torch import if semantic caching is used
+                        from sentence_transformers import SentenceTransformer
+                        self._model = SentenceTransformer(self.model_name)
+                    except Exception as e:
+                        self._model_failed = True
+                        print(f"⚠ Semantic cache disabled, could not load {self.model_name}: {e}")
+        return self._model
+    
+    def embed(self, text: str) -> Optional[np.ndarray]:
+        """Embed text as a normalized (1, dim) float32 vector. CPU-bound."""
+        model = self._get_model()
+        if model is None:
+            return None
+        return model.encode(
+            [text], normalize_embeddings=True, convert_to_numpy=True
+        ).astype('float32')
+    
+    def lookup(self, scope: str, embedding: np.ndarray, text: str,
+               threshold: float) -> Optional[bytes]:
+        """
+        Find the cache key of a semantically equivalent prompt in scope.
+        Numbers must match exactly: "under £100" and "under £500" embed
+        almost identically but must not share an answer.
+        """
+        entry = self._scopes.get(scope)
+        if entry is None or entry.index.ntotal == 0:
+            return None
+        
+        numbers = tuple(self._NUMBER_RE.findall(text))
+        scores, indices = entry.index.search(embedding, min(4, entry.index.ntotal))
+        for score, i in zip(scores[0], indices[0]):
+            if score < threshold:
+                break
+            if entry.numbers[i] == numbers:
+                return entry.keys[i]
+        return None
+    
+    def add(self, scope: str, embedding: np.ndarray, text: str, key: bytes):
+        """Index a prompt embedding under the cache key of its response."""
+        entry = self._scopes.get(scope)
+        if entry is None:
+            entry = self._scopes[scope] = _SemanticScope(embedding.shape[1])
+        
+        # Full: keep the newest half (older responses have likely expired)
+        if entry.index.ntotal >= self.max_entries:
+            keep_from = entry.index.ntotal // 2
+            vectors = entry.index.reconstruct_n(keep_from, entry.index.ntotal - keep_from)
+            entry.index.reset()
+            entry.index.add(vectors)
+            entry.keys = entry.keys[keep_from:]
+            entry.numbers = entry.numbers[keep_from:]
+        
+        entry.index.add(embedding)
+        entry.keys.append(key)
+        entry.numbers.append(tuple(self._NUMBER_RE.findall(text)))
+    
+    def clear(self):
+        """Drop all semantic indexes."""
+        self._scopes.clear()
 
 
 # Global cache instances
-recommendation_cache = TTLCache(ttl_seconds=3600, max_size=5000)
+recommendation_cache = TTLCache(ttl_seconds=600, max_size=100_000)
 embedding_cache = TTLCache(ttl_seconds=7200, max_size=10000)
 user_profile_cache = TTLCache(ttl_seconds=1800, max_size=5000)
 llm_response_cache = TTLCache(ttl_seconds=3600, max_size=2000)
+catalog_cache = TTLCache(ttl_seconds=3600, max_size=16)  # categories, popular products
+llm_semantic_cache = SemanticCache(max_entries=2000)
+
+
+# Interned "prefix:" keys for the per-request helpers below: one
+# concatenation per key, no call or formatting
+_REC_PREFIX = sys.intern("rec:")
+_PROFILE_PREFIX = sys.intern("profile:")
+# LLM keys are raw digest bytes (no hex formatting), shared with Redis
+_LLM_PREFIX = b"llm:"
+
+# Redis LLM values: one tag byte, then raw UTF-8 or zstd-compressed bytes.
+# Batch explanations are JSON and compress ~3-4x at level 1.
+_RAW_TAG = b"R"
+_ZSTD_TAG = b"Z"
+_COMPRESS_MIN_BYTES = 512
+_zstd_compressor = zstandard.ZstdCompressor(level=1)
+_zstd_decompressor = zstandard.ZstdDecompressor()
 
 
 def generate_cache_key(*args, **kwargs) -> str:
-    """Generate deterministic cache key from arguments."""
-    key_data = json.dumps({"args": args, "kwargs": kwargs}, sort_keys=True)
-    return hashlib.md5(key_data.encode()).hexdigest()
+    """
+    Generate deterministic cache key from arbitrary arguments.
+    ID-keyed caches concatenate their interned prefix with the ID instead.
+    """
+    key_data = orjson.dumps(
+        {"args": args, "kwargs": kwargs},
+        option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+    )
+    # 64-bit non-cryptographic hash is plenty for in-process cache keys
+    return xxhash.xxh3_64_hexdigest(key_data)
 
 
 def cache_recommendations(user_id: str, recommendations: list):
     """Cache user recommendations."""
-    recommendation_cache.set(f"rec_{user_id}", recommendations)
+    recommendation_cache.set(_REC_PREFIX + user_id, recommendations)
 
 
 def get_cached_recommendations(user_id: str) -> Optional[list]:
     """Get cached recommendations for user."""
-    return recommendation_cache.get(f"rec_{user_id}")
+    return recommendation_cache.get(_REC_PREFIX + user_id)
 
 
 def cache_user_profile(user_id: str, profile: dict):
     """Cache user profile."""
-    user_profile_cache.set(f"profile_{user_id}", profile)
+    user_profile_cache.set(_PROFILE_PREFIX + user_id, profile)
 
 
 def get_cached_user_profile(user_id: str) -> Optional[dict]:
     """Get cached user profile."""
-    return user_profile_cache.get(f"profile_{user_id}")
+    return user_profile_cache.get(_PROFILE_PREFIX + user_id)
 
 
-def cache_llm_response(prompt_hash: str, response: str):
+def cache_llm_response(prompt_hash: bytes, response: str):
     """Cache LLM response to avoid redundant API calls."""
-    llm_response_cache.set(f"llm_{prompt_hash}", response)
+    llm_response_cache.set(_LLM_PREFIX + prompt_hash, response)
 
 
-def get_cached_llm_response(prompt_hash: str) -> Optional[str]:
+def get_cached_llm_response(prompt_hash: bytes) -> Optional[str]:
     """Get cached LLM response."""
-    return llm_response_cache.get(f"llm_{prompt_hash}")
+    return llm_response_cache.get(_LLM_PREFIX + prompt_hash)
+
+
+async def get_shared_llm_response(prompt_hash: bytes) -> Optional[str]:
+    """
+    Get an LLM response cached in Redis by any worker.
+    Hits are copied into the in-process cache, so each is decoded once.
+    """
+    redis = get_redis()
+    if redis is None:
+        return None
+    try:
+        value = await redis.get(_LLM_PREFIX + prompt_hash)
+    except RedisError:
+        return None
+    if value is None:
+        return None
+    
+    tag, payload = value[:1], value[1:]
+    if tag == _ZSTD_TAG:
+        payload = _zstd_decompressor.decompress(payload)
+    elif tag != _RAW_TAG:
+        return None  # Unknown format; treat as a miss
+    
+    response = payload.decode()
+    cache_llm_response(prompt_hash, response)
+    return response
+
+
+async def share_llm_response(prompt_hash: bytes, response: str):
+    """Store an LLM response in Redis for all workers (zstd if large)."""
+    redis = get_redis()
+    if redis is None:
+        return
+    
+    payload = response.encode()
+    if len(payload) > _COMPRESS_MIN_BYTES:
+        value = _ZSTD_TAG + _zstd_compressor.compress(payload)
+    else:
+        value = _RAW_TAG + payload
+    
+    try:
+        await redis.set(
+            _LLM_PREFIX + prompt_hash, value,
+            ex=llm_response_cache.ttl_seconds
+        )
+    except RedisError:
+        pass
+
+
+def cache_categories(categories: list):
+    """Cache list of product categories."""
+    catalog_cache.set("categories", categories)
+
+
+def get_cached_categories() -> Optional[list]:
+    """Get cached product categories."""
+    return catalog_cache.get("categories")
+
+
+def cache_popular_products(products: list):
+    """Cache globally popular products."""
+    catalog_cache.set("popular_products", products)
+
+
+def get_cached_popular_products() -> Optional[list]:
+    """Get cached popular products."""
+    return catalog_cache.get("popular_products")
+
+
+def expire_all_caches() -> int:
+    """Evict expired entries from every cache (e.g. on an idle timer)."""
+    return sum(
+        cache.expire()
+        for cache in (recommendation_cache, embedding_cache, user_profile_cache,
+                      llm_response_cache, catalog_cache)
+    )
+
+
+def get_cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Per-cache size and hit/miss statistics."""
+    return {
+        'recommendations': recommendation_cache.stats(),
+        'embeddings': embedding_cache.stats(),
+        'user_profiles': user_profile_cache.stats(),
+        'llm_responses': llm_response_cache.stats(),
+        'catalog': catalog_cache.stats()
+    }
 
 
 def clear_all_caches():
@@ -98,3 +336,5 @@ def clear_all_caches():
     embedding_cache.clear()
     user_profile_cache.clear()
     llm_response_cache.clear()
+    catalog_cache.clear()
+    llm_semantic_cache.clear()
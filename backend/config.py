@@ -3,7 +3,6 @@ Configuration management for the recommendation system.
 Optimized for performance and scalability.
 """
 from pydantic_settings import BaseSettings
-from functools import lru_cache
 
 
 class Settings(BaseSettings):
@@ -11,12 +10,20 @@ class Settings(BaseSettings):
     MONGODB_URL: str = "mongodb://localhost:27017"
     DATABASE_NAME: str = "recommendation_system"
     
+    # Redis Configuration (shared state across workers)
+    REDIS_URL: str = "redis://localhost:6379/0"
+    
     # LLM Configuration (Groq)
     GROQ_API_KEY: str = ""
     LLM_MODEL: str = "llama-3.3-70b-versatile"  # Fast model for explanations
     LLM_MODEL_ADVANCED: str = "llama-3.3-70b-versatile"  # For complex cold-start reasoning
     LLM_MAX_TOKENS: int = 150
     LLM_TEMPERATURE: float = 0.7
+    LLM_MAX_CONCURRENCY: int = 32  # Concurrent Groq requests per worker
+    
+    # API Server
+    API_WORKERS: int = 4
+    LOG_LEVEL: str = "INFO"  # INFO logs every request's latency; WARNING only slow ones
     
     # Performance Constraints
     RECOMMENDATION_TIMEOUT_MS: int = 500
@@ -34,10 +41,16 @@ class Settings(BaseSettings):
     # Cold Start Configuration
     MIN_PURCHASES_FOR_CF: int = 5  # Minimum purchases to use collaborative filtering
     COLD_START_POPULAR_ITEMS: int = 20
+    COLD_START_SESSION_TTL_SECONDS: int = 1800  # 30 minutes
+    COLD_START_DYNAMIC_QUESTIONS: bool = False  # LLM-generated questions instead of the static set
     
     # Cache Configuration
     CACHE_TTL_SECONDS: int = 3600  # 1 hour
     MAX_CACHE_SIZE: int = 10000
+    SEMANTIC_CACHE_ENABLED: bool = True  # Reuse LLM answers for paraphrased prompts
+    # Pre-generate insights for common user archetypes at startup. Seeds each
+    # worker's own semantic cache, so every worker makes its own Groq calls
+    LLM_WARMUP_ENABLED: bool = False
     
     # Data Processing
     BATCH_SIZE: int = 1000
@@ -48,7 +61,10 @@ class Settings(BaseSettings):
         case_sensitive = True
 
 
-@lru_cache()
+# Environment is read once at import; every caller shares this instance
+settings = Settings()
+
+
 def get_settings() -> Settings:
-    """Get cached settings instance."""
-    return Settings()
+    """Get the shared settings instance."""
+    return settings
@@ -22,8 +22,13 @@ async def connect_to_mongo():
     db.client = AsyncIOMotorClient(
         settings.MONGODB_URL,
         maxPoolSize=50,  # Handle concurrent requests
-        minPoolSize=10,
+        minPoolSize=0,  # Don't hold idle sockets open in every worker
         maxIdleTimeMS=45000,
+        # Fail fast instead of stalling requests for the 30s defaults
+        serverSelectionTimeoutMS=2000,
+        connectTimeoutMS=2000,
+        socketTimeoutMS=5000,
+        compressors='zstd',  # Wire compression for large result sets
     )
     db.db = db.client[settings.DATABASE_NAME]
     
@@ -51,11 +56,19 @@ async def create_indexes():
     await db.db.products.create_index("stock_code", unique=True)
     await db.db.products.create_index("category")
     await db.db.products.create_index("price")
-    await db.db.products.create_index([("category", 1), ("price", 1)])
+    # Category lookups sorted by popularity (cold-start, refinement)
+    await db.db.products.create_index([("category", 1), ("popularity_score", -1)])
+    # Global top-N popular products
+    await db.db.products.create_index([("popularity_score", -1)])
     
     # User profiles index
     await db.db.user_profiles.create_index("user_id", unique=True)
     
+    # Offline batch explanations, looked up per segment
+    await db.db.precomputed_explanations.create_index(
+        [("segment", 1), ("product_id", 1)], unique=True
+    )
+    
     # Product embeddings index
     await db.db.product_embeddings.create_index("product_id", unique=True)
     
@@ -2,17 +2,41 @@
 FastAPI main application.
 Production-ready recommendation system backend.
 """
+import asyncio
+import logging
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from contextlib import asynccontextmanager
 
+from backend.cache import expire_all_caches, get_cache_stats
 from backend.database import connect_to_mongo, close_mongo_connection
+from backend.redis_client import connect_to_redis, close_redis_connection
+from backend.services.llm_service import llm_service
+from backend.services.recommendation_service import recommendation_service
 from backend.config import get_settings
 from backend.middleware.performance_monitor import PerformanceMonitorMiddleware
+from backend.middleware.request_context import RequestContextMiddleware
 from backend.routes import recommendation_routes, search_routes, cold_start_routes
 
 settings = get_settings()
 
+# Request timing and performance warnings are logged, not printed
+logging.basicConfig(level=settings.LOG_LEVEL.upper(), format="%(message)s")
+
+CACHE_EXPIRY_INTERVAL_SECONDS = 60
+
+
+async def expire_caches_periodically():
+    """
+    Evict expired cache entries in the background.
+    Caches only expire on writes, so read-heavy ones would otherwise hold
+    stale entries in memory until the next write.
+    """
+    while True:
+        await asyncio.sleep(CACHE_EXPIRY_INTERVAL_SECONDS)
+        expire_all_caches()
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -23,6 +47,12 @@ async def lifespan(app: FastAPI):
     print("="*60 + "\n")
     
     await connect_to_mongo()
+    await connect_to_redis()
+    expiry_task = asyncio.create_task(expire_caches_periodically())
+    # Warm in the background so startup isn't blocked on Groq
+    warmup_task = None
+    if settings.LLM_WARMUP_ENABLED:
+        warmup_task = asyncio.create_task(recommendation_service.warmup_llm_cache())
     
     print("\n✓ API Ready")
     print(f"  Docs: http://localhost:8000/docs")
@@ -34,6 +64,11 @@ async def lifespan(app: FastAPI):
     yield
     
     # Shutdown
+    expiry_task.cancel()
+    if warmup_task:
+        warmup_task.cancel()
+    await llm_service.aclose()
+    await close_redis_connection()
     await close_mongo_connection()
     print("\n✓ API Shutdown Complete\n")
 
@@ -43,7 +78,8 @@ app = FastAPI(
     title="LLM-Enhanced Recommendation System",
     description="Production-ready recommendation engine with hybrid ML and LLM explanations",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse  # orjson serializes responses in Rust
 )
 
 # Add CORS middleware
@@ -58,6 +94,9 @@ app.add_middleware(
 # Add performance monitoring
 app.add_middleware(PerformanceMonitorMiddleware)
 
+# Add per-request memo scope
+app.add_middleware(RequestContextMiddleware)
+
 # Include routers
 app.include_router(recommendation_routes.router)
 app.include_router(search_routes.router)
@@ -85,8 +124,8 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint."""
-    return {"status": "healthy"}
+    """Health check endpoint, with cache statistics for this worker."""
+    return {"status": "healthy", "caches": get_cache_stats()}
 
 
 if __name__ == "__main__":
@@ -95,5 +134,8 @@ if __name__ == "__main__":
         "backend.main:app",
         host="0.0.0.0",
         port=8000,
-        reload=True
+        loop="uvloop",  # libuv event loop
+        http="httptools",  # C HTTP parser instead of h11
+        workers=settings.API_WORKERS,
+        reload=False  # reload forces a single worker; use `uvicorn --reload` for dev
     )
@@ -2,10 +2,13 @@
 Performance monitoring middleware.
 Tracks request latency and ensures performance constraints are met.
 """
+import logging
 import time
 from fastapi import Request
 from starlette.middleware.base import BaseHTTPMiddleware
 
+logger = logging.getLogger(__name__)
+
 
 class PerformanceMonitorMiddleware(BaseHTTPMiddleware):
     """
@@ -14,27 +17,28 @@ class PerformanceMonitorMiddleware(BaseHTTPMiddleware):
     """
     
     async def dispatch(self, request: Request, call_next):
-        start_time = time.time()
+        start_ns = time.perf_counter_ns()
         
         # Process request
         response = await call_next(request)
         
-        # Calculate latency
-        latency_ms = (time.time() - start_time) * 1000
+        # Calculate latency (monotonic, unaffected by clock adjustments)
+        latency_ms = (time.perf_counter_ns() - start_ns) / 1_000_000
         
         # Add latency header
-        response.headers["X-Processing-Time-Ms"] = str(round(latency_ms, 2))
+        response.headers["X-Processing-Time-Ms"] = f"{latency_ms:.2f}"
         
         # Check performance constraints
         path = request.url.path
         
         if "/recommendations/" in path and latency_ms > 500:
-            print(f"⚠ PERFORMANCE WARNING: Recommendation latency {latency_ms:.2f}ms > 500ms target")
+            logger.warning("⚠ PERFORMANCE WARNING: Recommendation latency %.2fms > 500ms target", latency_ms)
         
         if "/search/natural" in path and latency_ms > 2000:
-            print(f"⚠ PERFORMANCE WARNING: Search latency {latency_ms:.2f}ms > 2000ms target")
+            logger.warning("⚠ PERFORMANCE WARNING: Search latency %.2fms > 2000ms target", latency_ms)
         
-        # Log request
-        print(f"{request.method} {path} - {latency_ms:.2f}ms")
+        # Log request (skip formatting entirely when INFO is disabled)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("%s %s - %.2fms", request.method, path, latency_ms)
         
         return response
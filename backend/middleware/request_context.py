@@ -0,0 +1,28 @@
+"""
+Request-scoped context middleware.
+Gives each request a fresh memo for data fetched more than once per request.
+"""
+from contextvars import ContextVar
+from typing import Dict, Optional
+from fastapi import Request
+from starlette.middleware.base import BaseHTTPMiddleware
+
+# user_id -> profile, for the current request only (None outside a request)
+request_profiles: ContextVar[Optional[Dict[str, dict]]] = ContextVar(
+    'request_profiles', default=None
+)
+
+
+class RequestContextMiddleware(BaseHTTPMiddleware):
+    """
+    Middleware that scopes per-request memos.
+    Values set here are inherited by the endpoint's context and dropped
+    when the request completes.
+    """
+    
+    async def dispatch(self, request: Request, call_next):
+        token = request_profiles.set({})
+        try:
+            return await call_next(request)
+        finally:
+            request_profiles.reset(token)
@@ -2,16 +2,23 @@
 Pydantic models for MongoDB documents.
 Optimized for fast serialization and validation.
 """
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_serializer
+from pydantic_core import core_schema
 from typing import List, Dict, Optional
-from datetime import datetime
+from datetime import datetime, timezone
+import time
 from bson import ObjectId
 
 
+def epoch_to_iso(ts: float) -> str:
+    """Render an epoch-seconds timestamp as ISO 8601 (UTC) at the API boundary."""
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat()
+
+
 class PyObjectId(ObjectId):
     @classmethod
-    def __get_validators__(cls):
-        yield cls.validate
+    def __get_pydantic_core_schema__(cls, source_type, handler):
+        return core_schema.no_info_plain_validator_function(cls.validate)
 
     @classmethod
     def validate(cls, v):
@@ -20,20 +27,27 @@ class PyObjectId(ObjectId):
         return ObjectId(v)
 
     @classmethod
-    def __get_pydantic_json_schema__(cls, field_schema):
-        field_schema.update(type="string")
+    def __get_pydantic_json_schema__(cls, schema, handler):
+        return {"type": "string"}
 
 
 class User(BaseModel):
     id: Optional[PyObjectId] = Field(alias="_id", default=None)
     customer_id: str
-    created_at: datetime = Field(default_factory=datetime.utcnow)
-    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: float = Field(default_factory=time.time)
+    updated_at: float = Field(default_factory=time.time)
 
     class Config:
         populate_by_name = True
         arbitrary_types_allowed = True
-        json_encoders = {ObjectId: str}
+
+    @field_serializer('id')
+    def serialize_object_id(self, v: Optional[ObjectId]) -> Optional[str]:
+        return str(v) if v is not None else None
+
+    @field_serializer('created_at', 'updated_at')
+    def serialize_timestamp(self, v: float) -> str:
+        return epoch_to_iso(v)
 
 
 class Product(BaseModel):
@@ -43,12 +57,19 @@ class Product(BaseModel):
     category: str
     price: float
     popularity_score: float = 0.0
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: float = Field(default_factory=time.time)
 
     class Config:
         populate_by_name = True
         arbitrary_types_allowed = True
-        json_encoders = {ObjectId: str}
+
+    @field_serializer('id')
+    def serialize_object_id(self, v: Optional[ObjectId]) -> Optional[str]:
+        return str(v) if v is not None else None
+
+    @field_serializer('created_at')
+    def serialize_timestamp(self, v: float) -> str:
+        return epoch_to_iso(v)
 
 
 class Transaction(BaseModel):
@@ -63,7 +84,10 @@ class Transaction(BaseModel):
     class Config:
         populate_by_name = True
         arbitrary_types_allowed = True
-        json_encoders = {ObjectId: str}
+
+    @field_serializer('id', 'user_id', 'product_id')
+    def serialize_object_id(self, v: Optional[ObjectId]) -> Optional[str]:
+        return str(v) if v is not None else None
 
 
 class UserProfile(BaseModel):
@@ -75,12 +99,19 @@ class UserProfile(BaseModel):
     top_categories: List[str]
     brand_affinity: Dict[str, float]  # brand -> affinity score
     price_sensitivity: str  # "low", "medium", "high"
-    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: float = Field(default_factory=time.time)
 
     class Config:
         populate_by_name = True
         arbitrary_types_allowed = True
-        json_encoders = {ObjectId: str}
+
+    @field_serializer('id', 'user_id')
+    def serialize_object_id(self, v: Optional[ObjectId]) -> Optional[str]:
+        return str(v) if v is not None else None
+
+    @field_serializer('updated_at')
+    def serialize_timestamp(self, v: float) -> str:
+        return epoch_to_iso(v)
 
 
 class ProductEmbedding(BaseModel):
@@ -88,12 +119,19 @@ class ProductEmbedding(BaseModel):
     product_id: PyObjectId
     embedding_vector: List[float]
     model_version: str
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: float = Field(default_factory=time.time)
 
     class Config:
         populate_by_name = True
         arbitrary_types_allowed = True
-        json_encoders = {ObjectId: str}
+
+    @field_serializer('id', 'product_id')
+    def serialize_object_id(self, v: Optional[ObjectId]) -> Optional[str]:
+        return str(v) if v is not None else None
+
+    @field_serializer('created_at')
+    def serialize_timestamp(self, v: float) -> str:
+        return epoch_to_iso(v)
 
 
 # API Response Models
@@ -0,0 +1,39 @@
+"""
+Redis async connection for state shared across API workers.
+Used for session data that must survive worker hops.
+"""
+from redis.asyncio import Redis
+from typing import Optional
+from backend.config import get_settings
+
+settings = get_settings()
+
+
+class RedisConnection:
+    client: Optional[Redis] = None
+
+
+redis_conn = RedisConnection()
+
+
+async def connect_to_redis():
+    """Connect to Redis (connections are pooled by the client)."""
+    redis_conn.client = Redis.from_url(settings.REDIS_URL)
+    
+    try:
+        await redis_conn.client.ping()
+        print(f"✓ Connected to Redis: {settings.REDIS_URL}")
+    except Exception as e:
+        print(f"⚠ Warning: Redis unavailable ({e}). Cold-start sessions will fail until it is reachable")
+
+
+async def close_redis_connection():
+    """Close Redis connection pool."""
+    if redis_conn.client:
+        await redis_conn.client.aclose()
+        print("✓ Closed Redis connection")
+
+
+def get_redis() -> Redis:
+    """Get Redis client instance."""
+    return redis_conn.client
@@ -2,6 +2,7 @@
 FastAPI routes for recommendation endpoints.
 """
 from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from backend.services.recommendation_service import recommendation_service
 from backend.models import RecommendationResponse
 
@@ -34,6 +35,27 @@ async def get_recommendations(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/{user_id}/stream")
+async def stream_recommendations(
+    user_id: str,
+    top_k: int = Query(10, ge=1, le=50)
+):
+    """
+    Stream personalized recommendations with explanations (server-sent events).
+    
+    - **user_id**: Customer ID
+    - **top_k**: Number of recommendations (1-50)
+    
+    Sends the ranked list immediately, then each LLM explanation as soon
+    as it is generated.
+    """
+    return StreamingResponse(
+        recommendation_service.stream_recommendations(user_id=user_id, top_k=top_k),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
+    )
+
+
 @router.get("/{user_id}/insight")
 async def get_user_insight(user_id: str):
     """
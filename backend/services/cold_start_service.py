@@ -2,18 +2,63 @@
 Cold Start Service - Handle new users with no purchase history.
 Uses LLM reasoning and iterative refinement.
 """
+import asyncio
+import orjson
 from typing import List, Dict, Optional
+from backend.config import get_settings
+from backend.cache import (
+    get_cached_categories, cache_categories,
+    get_cached_popular_products, cache_popular_products
+)
 from backend.database import get_database
+from backend.redis_client import get_redis
 from backend.services.llm_service import llm_service
 
+settings = get_settings()
+
+SESSION_KEY_PREFIX = "cs:"
+
+# Only the fields we return - skips decoding large unused fields
+PRODUCT_PROJECTION = {'_id': 0, 'stock_code': 1, 'description': 1, 'category': 1, 'price': 1}
+
 
 class ColdStartService:
     """
     Service for handling cold-start scenarios with new users.
+    Sessions live in Redis so any API worker can serve any step.
     """
     
-    def __init__(self):
-        self.sessions = {}  # In-memory session storage (use Redis in production)
+    async def _save_session(self, session_id: str, session: Dict):
+        """Persist session state with a sliding TTL."""
+        await get_redis().set(
+            SESSION_KEY_PREFIX + session_id,
+            orjson.dumps(session),
+            ex=settings.COLD_START_SESSION_TTL_SECONDS
+        )
+    
+    async def _load_session(self, session_id: str) -> Optional[Dict]:
+        """Load session state, or None if missing/expired."""
+        raw = await get_redis().get(SESSION_KEY_PREFIX + session_id)
+        return orjson.loads(raw) if raw is not None else None
+    
+    async def _get_categories(self, db) -> List[str]:
+        """Get product categories (cached - they rarely change)."""
+        categories = get_cached_categories()
+        if categories is None:
+            categories = await db.products.distinct('category')
+            cache_categories(categories)
+        return categories
+    
+    async def _get_popular_products(self, db) -> List[Dict]:
+        """Get globally popular products (cached, refreshed hourly)."""
+        popular_products = get_cached_popular_products()
+        if popular_products is None:
+            popular_products_cursor = db.products.find(
+                {}, projection=PRODUCT_PROJECTION
+            ).sort('popularity_score', -1).limit(20)
+            popular_products = await popular_products_cursor.to_list(length=20)
+            cache_popular_products(popular_products)
+        return popular_products
     
     async def initialize_cold_start(self, session_id: str) -> Dict:
         """
@@ -29,11 +74,11 @@ class ColdStartService:
         questions = await llm_service.generate_cold_start_questions()
         
         # Initialize session
-        self.sessions[session_id] = {
+        await self._save_session(session_id, {
             'questions': questions,
             'responses': {},
             'current_question_index': 0
-        }
+        })
         
         return {
             'session_id': session_id,
@@ -54,15 +99,17 @@ class ColdStartService:
         Returns:
             Dict with next question or recommendations
         """
-        if session_id not in self.sessions:
+        session = await self._load_session(session_id)
+        if session is None:
             return {'error': 'Invalid session'}
         
-        session = self.sessions[session_id]
         questions = session['questions']
         
         # Store response
         if question_index < len(questions):
             session['responses'][questions[question_index]] = response
+            session['current_question_index'] = question_index + 1
+            await self._save_session(session_id, session)
         
         # Check if more questions
         next_index = question_index + 1
@@ -87,10 +134,11 @@ class ColdStartService:
         """Generate recommendations based on cold-start responses."""
         db = get_database()
         
-        # Get available categories and popular products
-        categories = await db.products.distinct('category')
-        popular_products_cursor = db.products.find().sort('popularity_score', -1).limit(20)
-        popular_products = await popular_products_cursor.to_list(length=20)
+        # Get available categories and popular products concurrently
+        categories, popular_products = await asyncio.gather(
+            self._get_categories(db),
+            self._get_popular_products(db)
+        )
         
         popular_list = [
             {
@@ -108,19 +156,18 @@ class ColdStartService:
             popular_products=popular_list
         )
         
-        # Match LLM recommendations to actual products
+        # Match LLM recommendations to actual products - one query per
+        # recommended category, all in flight at once over the pool
+        category_products = await asyncio.gather(*(
+            db.products.find(
+                {'category': llm_rec.get('product_category')}, projection=PRODUCT_PROJECTION
+            ).sort('popularity_score', -1).limit(3).to_list(length=3)
+            for llm_rec in llm_recommendations
+        ))
+        
         final_recommendations = []
         
-        for llm_rec in llm_recommendations:
-            category = llm_rec.get('product_category')
-            
-            # Find products in this category
-            products_cursor = db.products.find(
-                {'category': category}
-            ).sort('popularity_score', -1).limit(3)
-            
-            products = await products_cursor.to_list(length=3)
-            
+        for llm_rec, products in zip(llm_recommendations, category_products):
             for product in products:
                 final_recommendations.append({
                     'product_id': product['stock_code'],
@@ -144,7 +191,7 @@ class ColdStartService:
         Returns:
             Dict with refined recommendations
         """
-        if session_id not in self.sessions:
+        if not await get_redis().exists(SESSION_KEY_PREFIX + session_id):
             return {'error': 'Invalid session'}
         
         db = get_database()
@@ -157,26 +204,45 @@ class ColdStartService:
         refined = []
         
         if liked_ids:
-            for product_id in liked_ids:
-                product = await db.products.find_one({'stock_code': product_id})
-                
-                if product:
-                    # Find similar products in same category
-                    similar_cursor = db.products.find({
-                        'category': product['category'],
-                        'stock_code': {'$nin': liked_ids + disliked_ids}
-                    }).sort('popularity_score', -1).limit(5)
-                    
-                    similar = await similar_cursor.to_list(length=5)
-                    
-                    for sim_product in similar:
-                        refined.append({
-                            'product_id': sim_product['stock_code'],
-                            'product_name': sim_product['description'],
-                            'category': sim_product['category'],
-                            'price': sim_product['price'],
-                            'reasoning': f"Similar to products you liked in {product['category']}"
-                        })
+            excluded_ids = liked_ids + disliked_ids
+            
+            # One round-trip: liked products -> their categories -> top
+            # similar products per category
+            pipeline = [
+                {'$match': {'stock_code': {'$in': liked_ids}}},
+                {'$group': {
+                    '_id': '$category',
+                    # Keep categories in the user's like order
+                    'order': {'$min': {'$indexOfArray': [liked_ids, '$stock_code']}}
+                }},
+                {'$sort': {'order': 1}},
+                {'$lookup': {
+                    'from': 'products',
+                    'let': {'cat': '$_id'},
+                    'pipeline': [
+                        {'$match': {
+                            '$expr': {'$eq': ['$category', '$$cat']},
+                            'stock_code': {'$nin': excluded_ids}
+                        }},
+                        {'$sort': {'popularity_score': -1}},
+                        {'$limit': 5},
+                        {'$project': PRODUCT_PROJECTION}
+                    ],
+                    'as': 'similar'
+                }}
+            ]
+            groups = await db.products.aggregate(pipeline).to_list(length=None)
+            
+            for group in groups:
+                category = group['_id']
+                for sim_product in group['similar']:
+                    refined.append({
+                        'product_id': sim_product['stock_code'],
+                        'product_name': sim_product['description'],
+                        'category': sim_product['category'],
+                        'price': sim_product['price'],
+                        'reasoning': f"Similar to products you liked in {category}"
+                    })
         
         return {
             'session_id': session_id,
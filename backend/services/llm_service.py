@@ -3,24 +3,119 @@ LLM Service for generating explanations and handling cold-start scenarios.
 Optimized with caching to minimize API calls and latency.
 Uses Groq API for fast, cost-effective inference.
 """
-from groq import AsyncGroq
-import json
-import hashlib
-from typing import Dict, List, Optional
+from groq import AsyncGroq, DefaultAioHttpClient
+import asyncio
+import httpx
+import orjson
+import xxhash
+from collections import Counter
+from typing import Any, AsyncIterator, Awaitable, Dict, List, Optional, Tuple
 from backend.config import get_settings
-from backend.cache import cache_llm_response, get_cached_llm_response, generate_cache_key
+from backend.cache import (
+    cache_llm_response, get_cached_llm_response,
+    get_shared_llm_response, share_llm_response, llm_semantic_cache
+)
 from backend.services.prompts import (
+    SYSTEM_PROMPT,
     format_user_insight_prompt,
+    user_insight_profile_text,
     format_recommendation_explanation_prompt,
     format_query_understanding_prompt,
     format_search_explanation_prompt,
     format_batch_explanation_prompt,
+    format_composite_prompt,
+    COLD_START_QUESTIONS,
     COLD_START_QUESTIONS_PROMPT,
     COLD_START_REASONING_PROMPT
 )
 
 settings = get_settings()
 
+# Prompt templates eligible for semantic (paraphrase-tolerant) cache hits,
+# with the cosine similarity required for a hit. Templates embedding
+# per-product data (explanations) stay on exact-match keys.
+SEMANTIC_CACHE_THRESHOLDS = {
+    'user_insight': 0.95,
+    'query_understanding': 0.90,
+}
+
+# Micro-batching of single-answer prompts (see _call_llm_coalesced)
+LLM_BATCH_WINDOW_SECONDS = 0.01
+LLM_BATCH_MAX_SIZE = 16
+
+# Max concurrent Groq calls when fanning out per-item prompts
+LLM_FANOUT_CONCURRENCY = 20
+
+
+async def gather_bounded(coros: List[Awaitable[Any]],
+                         limit: int = LLM_FANOUT_CONCURRENCY) -> List[Any]:
+    """
+    Run coroutines concurrently, at most `limit` at a time.
+    Exceptions are returned in place of results (like return_exceptions=True).
+    """
+    semaphore = asyncio.Semaphore(limit)
+    
+    async def bounded(coro):
+        async with semaphore:
+            return await coro
+    
+    return await asyncio.gather(*(bounded(c) for c in coros), return_exceptions=True)
+
+
+class _JsonObjectScanner:
+    """
+    Incrementally extract top-level objects from a streamed JSON array.
+    Tracks brace depth outside of strings, so each object can be parsed
+    as soon as its closing brace arrives.
+    """
+    
+    __slots__ = ("_buffer", "_depth", "_in_string", "_escaped")
+    
+    def __init__(self):
+        self._buffer: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+    
+    def feed(self, text: str) -> List[Any]:
+        """Consume a chunk of text, returning any objects it completed."""
+        objects = []
+        for char in text:
+            if self._depth:
+                self._buffer.append(char)
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == '{':
+                if self._depth == 0:
+                    self._buffer = ['{']
+                self._depth += 1
+            elif char == '}' and self._depth:
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        objects.append(orjson.loads(''.join(self._buffer)))
+                    except orjson.JSONDecodeError:
+                        pass
+        return objects
+
+
+class _PendingBatch:
+    """Prompts of one template waiting to be sent as a composite request."""
+    
+    __slots__ = ("items", "timer")
+    
+    def __init__(self):
+        # prompt hash -> (prompt, future); identical prompts share a future
+        self.items: Dict[bytes, Tuple[str, asyncio.Future]] = {}
+        self.timer: Optional[asyncio.TimerHandle] = None
+
 
 class LLMService:
     """
@@ -28,17 +123,52 @@ class LLMService:
     Uses Groq API with caching to improve performance and reduce API costs.
     """
     
+    # Settings are bound to slots once at construction, so the hot
+    # _call_llm path reads fixed-offset attributes instead of going
+    # through the settings model or an instance dict
+    __slots__ = (
+        "client", "model", "model_advanced", "max_tokens", "temperature",
+        "semantic_cache_enabled", "_inflight", "_semaphore", "_pending",
+        "_batch_tasks"
+    )
+    
     def __init__(self):
         self.client = None
         if settings.GROQ_API_KEY:
-            self.client = AsyncGroq(api_key=settings.GROQ_API_KEY)
+            # aiohttp transport with a large keep-alive pool for bursty fan-out
+            self.client = AsyncGroq(
+                api_key=settings.GROQ_API_KEY,
+                http_client=DefaultAioHttpClient(
+                    limits=httpx.Limits(max_connections=1000, max_keepalive_connections=200)
+                )
+            )
         self.model = settings.LLM_MODEL
         self.model_advanced = settings.LLM_MODEL_ADVANCED
         self.max_tokens = settings.LLM_MAX_TOKENS
         self.temperature = settings.LLM_TEMPERATURE
+        self.semantic_cache_enabled = settings.SEMANTIC_CACHE_ENABLED
+        self._inflight: Dict[bytes, asyncio.Task] = {}
+        # Caps concurrent Groq requests across all callers
+        self._semaphore = asyncio.Semaphore(settings.LLM_MAX_CONCURRENCY)
+        self._pending: Dict[str, _PendingBatch] = {}
+        # Running _answer_batch tasks; the loop only holds weak references
+        self._batch_tasks: set = set()
+    
+    async def __aenter__(self) -> "LLMService":
+        return self
+    
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+    
+    async def aclose(self):
+        """Close the underlying HTTP session."""
+        if self.client:
+            await self.client.close()
     
     async def _call_llm(self, prompt: str, use_advanced: bool = False, 
-                       max_tokens: Optional[int] = None) -> str:
+                       max_tokens: Optional[int] = None,
+                       semantic_scope: Optional[str] = None,
+                       semantic_text: Optional[str] = None) -> str:
         """
         Call Groq LLM API with caching.
         
@@ -46,17 +176,58 @@ class LLMService:
             prompt: The prompt to send
             use_advanced: Whether to use advanced model
             max_tokens: Override default max tokens
+            semantic_scope: Template id (key of SEMANTIC_CACHE_THRESHOLDS) to
+                also match paraphrased prompts of the same template
+            semantic_text: Variable part of the prompt to embed (defaults to
+                the whole prompt)
             
         Returns:
             LLM response text
         """
         # Check cache first
-        prompt_hash = hashlib.md5(prompt.encode()).hexdigest()
+        prompt_hash = xxhash.xxh3_128_digest(prompt.encode())
         cached_response = get_cached_llm_response(prompt_hash)
         
         if cached_response:
             return cached_response
         
+        # Singleflight: concurrent misses for the same prompt share one Groq call
+        task = self._inflight.get(prompt_hash)
+        if task is None:
+            task = asyncio.ensure_future(self._call_llm_uncached(
+                prompt, prompt_hash, use_advanced, max_tokens,
+                semantic_scope, semantic_text
+            ))
+            self._inflight[prompt_hash] = task
+            task.add_done_callback(lambda _: self._inflight.pop(prompt_hash, None))
+        # Shielded so one caller being cancelled doesn't cancel the others
+        return await asyncio.shield(task)
+    
+    async def _call_llm_uncached(self, prompt: str, prompt_hash: bytes,
+                                 use_advanced: bool, max_tokens: Optional[int],
+                                 semantic_scope: Optional[str],
+                                 semantic_text: Optional[str]) -> str:
+        """Shared (Redis) and semantic cache lookups, then Groq call; caches the result."""
+        # Another worker may already have generated it
+        cached_response = await get_shared_llm_response(prompt_hash)
+        if cached_response:
+            return cached_response
+        
+        # A semantically equivalent earlier prompt of the same template
+        embedding = None
+        if (semantic_scope and not use_advanced and self.semantic_cache_enabled
+                and self.client):
+            semantic_text = semantic_text or prompt
+            embedding = await asyncio.to_thread(llm_semantic_cache.embed, semantic_text)
+            match_hash = embedding is not None and llm_semantic_cache.lookup(
+                semantic_scope, embedding, semantic_text,
+                SEMANTIC_CACHE_THRESHOLDS[semantic_scope]
+            )
+            if match_hash:
+                cached_response = get_cached_llm_response(match_hash)
+                if cached_response:
+                    return cached_response
+        
         # Check if client is initialized
         if not self.client:
             print("⚠ Groq API key not configured, using fallback responses")
@@ -65,28 +236,178 @@ class LLMService:
         # Call Groq API
         try:
             model = self.model_advanced if use_advanced else self.model
-            tokens = max_tokens or self.max_tokens
+            result = await self._complete(prompt, model, max_tokens or self.max_tokens)
+            
+            # Cache the response
+            cache_llm_response(prompt_hash, result)
+            await share_llm_response(prompt_hash, result)
+            if embedding is not None:
+                llm_semantic_cache.add(semantic_scope, embedding, semantic_text, prompt_hash)
+            
+            return result
             
+        except Exception as e:
+            print(f"Groq API error: {e}")
+            return self._get_fallback_response(prompt)
+    
+    async def _complete(self, prompt: str, model: str, max_tokens: int) -> str:
+        """One uncached Groq chat completion; raises on API errors."""
+        async with self._semaphore:
             response = await self.client.chat.completions.create(
                 model=model,
                 messages=[
-                    {"role": "system", "content": "You are a helpful e-commerce recommendation assistant. Provide concise, relevant responses."},
+                    {"role": "system", "content": SYSTEM_PROMPT},
                     {"role": "user", "content": prompt}
                 ],
-                max_tokens=tokens,
+                max_tokens=max_tokens,
                 temperature=self.temperature
             )
-            
-            result = response.choices[0].message.content.strip()
-            
-            # Cache the response
-            cache_llm_response(prompt_hash, result)
-            
-            return result
-            
+        return response.choices[0].message.content.strip()
+    
+    async def _call_llm_coalesced(self, template_id: str, prompt: str) -> str:
+        """
+        Like _call_llm, for single-answer prompts issued in parallel from
+        different coroutines: uncached prompts of the same template arriving
+        within LLM_BATCH_WINDOW_SECONDS (up to LLM_BATCH_MAX_SIZE) are
+        answered by one composite request.
+        """
+        prompt_hash = xxhash.xxh3_128_digest(prompt.encode())
+        cached_response = (get_cached_llm_response(prompt_hash)
+                           or await get_shared_llm_response(prompt_hash))
+        if cached_response:
+            return cached_response
+        if not self.client:
+            return await self._call_llm(prompt)
+        
+        batch = self._pending.get(template_id)
+        if batch is None:
+            batch = self._pending[template_id] = _PendingBatch()
+            batch.timer = asyncio.get_running_loop().call_later(
+                LLM_BATCH_WINDOW_SECONDS, self._flush_pending, template_id
+            )
+        
+        entry = batch.items.get(prompt_hash)
+        if entry is None:
+            entry = batch.items[prompt_hash] = (prompt, asyncio.get_running_loop().create_future())
+            if len(batch.items) >= LLM_BATCH_MAX_SIZE:
+                self._flush_pending(template_id)
+        return await asyncio.shield(entry[1])
+    
+    def _flush_pending(self, template_id: str):
+        """Send the pending batch for a template (timer or size triggered)."""
+        batch = self._pending.pop(template_id, None)
+        if batch is None:
+            return
+        batch.timer.cancel()
+        task = asyncio.ensure_future(self._answer_batch(list(batch.items.items())))
+        self._batch_tasks.add(task)
+        task.add_done_callback(self._batch_tasks.discard)
+    
+    async def _answer_batch(self, items: List[Tuple[bytes, Tuple[str, asyncio.Future]]]):
+        """Answer coalesced prompts and resolve their futures."""
+        prompts = [prompt for _, (prompt, _) in items]
+        try:
+            if len(prompts) == 1:
+                answers = [await self._call_llm(prompts[0])]
+            else:
+                answers = await self._answer_composite(items, prompts)
+        except Exception as e:
+            for _, (_, future) in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for (_, (_, future)), answer in zip(items, answers):
+            if not future.done():
+                future.set_result(answer)
+    
+    async def _answer_composite(self, items: List[Tuple[bytes, Tuple[str, asyncio.Future]]],
+                                prompts: List[str]) -> List[str]:
+        """
+        One composite call; falls back to individual calls if unparseable.
+        The composite response itself is not cached: only its per-prompt
+        answers are ever looked up.
+        """
+        try:
+            response = await self._complete(
+                format_composite_prompt(prompts), self.model, self.max_tokens * len(prompts)
+            )
         except Exception as e:
             print(f"Groq API error: {e}")
-            return self._get_fallback_response(prompt)
+            # Groq is failing; retrying each prompt alone would double the load
+            return [self._get_fallback_response(prompt) for prompt in prompts]
+        
+        try:
+            answers = orjson.loads(response)
+        except orjson.JSONDecodeError:
+            answers = None
+        
+        if (isinstance(answers, list) and len(answers) == len(prompts)
+                and all(isinstance(a, str) for a in answers)):
+            # Cache each answer under its own prompt for later single calls,
+            # here and (like _call_llm) in Redis for the other workers
+            answers = [answer.strip() for answer in answers]
+            for (prompt_hash, _), answer in zip(items, answers):
+                cache_llm_response(prompt_hash, answer)
+            await asyncio.gather(*(
+                share_llm_response(prompt_hash, answer)
+                for (prompt_hash, _), answer in zip(items, answers)
+            ))
+            return answers
+        
+        results = await gather_bounded([self._call_llm(prompt) for prompt in prompts])
+        return [
+            self._get_fallback_response(prompt) if isinstance(result, Exception) else result
+            for prompt, result in zip(prompts, results)
+        ]
+    
+    async def _stream_llm(self, prompt: str,
+                          max_tokens: Optional[int] = None) -> AsyncIterator[str]:
+        """
+        Stream the LLM response as text chunks.
+        Cached (or fallback) responses are yielded as a single chunk; the
+        full streamed text is cached under the same key as _call_llm.
+        """
+        prompt_hash = xxhash.xxh3_128_digest(prompt.encode())
+        cached_response = (get_cached_llm_response(prompt_hash)
+                           or await get_shared_llm_response(prompt_hash))
+        if cached_response:
+            yield cached_response
+            return
+        
+        if not self.client:
+            yield self._get_fallback_response(prompt)
+            return
+        
+        parts = []
+        try:
+            async with self._semaphore:
+                stream = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[
+                        {"role": "system", "content": SYSTEM_PROMPT},
+                        {"role": "user", "content": prompt}
+                    ],
+                    max_tokens=max_tokens or self.max_tokens,
+                    temperature=self.temperature,
+                    stream=True
+                )
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        parts.append(delta)
+                        yield delta
+        except Exception as e:
+            print(f"Groq API error: {e}")
+            if not parts:
+                yield self._get_fallback_response(prompt)
+            return
+        
+        result = ''.join(parts).strip()
+        cache_llm_response(prompt_hash, result)
+        await share_llm_response(prompt_hash, result)
     
     def _get_fallback_response(self, prompt: str) -> str:
         """Provide fallback response when LLM is unavailable."""
@@ -95,7 +416,7 @@ class LLMService:
         elif "explain" in prompt.lower() or "recommendation" in prompt.lower():
             return "This product matches your shopping preferences and price range."
         elif "query" in prompt.lower():
-            return json.dumps({"category": null, "intent": "general search", "features": [], "constraints": []})
+            return orjson.dumps({"category": None, "intent": "general search", "features": [], "constraints": []}).decode()
         else:
             return "Based on your preferences, this is a good match."
     
@@ -110,7 +431,11 @@ class LLMService:
             Insight text
         """
         prompt = format_user_insight_prompt(user_profile)
-        insight = await self._call_llm(prompt, use_advanced=False)
+        # Embed just the profile, not the template boilerplate
+        insight = await self._call_llm(
+            prompt, use_advanced=False,
+            semantic_scope='user_insight', semantic_text=user_insight_profile_text(user_profile)
+        )
         return insight
     
     async def explain_recommendation(self, product: Dict, user_profile: Dict, 
@@ -127,7 +452,7 @@ class LLMService:
             Explanation text
         """
         prompt = format_recommendation_explanation_prompt(product, user_profile, match_score)
-        explanation = await self._call_llm(prompt, use_advanced=False)
+        explanation = await self._call_llm_coalesced('recommendation_explanation', prompt)
         return explanation
     
     async def explain_recommendations_batch(self, products: List[Dict], 
@@ -146,7 +471,7 @@ class LLMService:
         
         try:
             response = await self._call_llm(prompt, use_advanced=False, max_tokens=500)
-            explanations_list = json.loads(response)
+            explanations_list = orjson.loads(response)
             
             # Convert to dict
             explanations = {
@@ -155,13 +480,89 @@ class LLMService:
             }
             return explanations
             
-        except json.JSONDecodeError:
-            # Fallback to individual explanations
+        except orjson.JSONDecodeError:
+            # Fallback to individual explanations, fetched concurrently
+            results = await gather_bounded([
+                self.explain_recommendation(product, user_profile, product.get('score', 0))
+                for product in products
+            ])
             explanations = {}
-            for product in products:
-                explanations[product['product_id']] = "Recommended based on your preferences."
+            for product, result in zip(products, results):
+                explanations[product['product_id']] = (
+                    "Recommended based on your preferences."
+                    if isinstance(result, Exception) else result
+                )
             return explanations
     
+    async def explain_recommendations_stream(
+            self, products: List[Dict], user_profile: Dict
+    ) -> AsyncIterator[Tuple[str, str]]:
+        """
+        Streaming variant of explain_recommendations_batch.
+        
+        Yields (product_id, explanation) pairs as soon as each object in the
+        LLM's JSON array is complete. Products the LLM skipped get a generic
+        explanation at the end.
+        """
+        prompt = format_batch_explanation_prompt(user_profile, products)
+        scanner = _JsonObjectScanner()
+        explained = set()
+        
+        async for text in self._stream_llm(prompt, max_tokens=500):
+            for item in scanner.feed(text):
+                if not isinstance(item, dict) or 'product_id' not in item:
+                    continue
+                product_id = item['product_id']
+                explained.add(product_id)
+                yield product_id, item.get('explanation', "Recommended based on your preferences.")
+        
+        for product in products:
+            if product['product_id'] not in explained:
+                yield product['product_id'], "Recommended based on your preferences."
+    
+    async def warmup(self, profiles: List[Dict], top_archetypes: int = 50) -> int:
+        """
+        Seed the LLM cache before real traffic arrives.
+        
+        Groups real user profiles by the banded text the user_insight
+        semantic scope embeds, and generates one insight per most common
+        archetype, so later customers with the same archetype hit the
+        semantic cache. Also pre-generates the dynamic cold-start questions
+        when they are enabled.
+        
+        Args:
+            profiles: User profile dicts, shaped as for generate_user_insight
+            top_archetypes: Number of most common archetypes to warm
+            
+        Returns:
+            Number of responses now cached
+        """
+        if not self.client:
+            return 0
+        
+        prompts = []
+        coros = []
+        if self.semantic_cache_enabled:
+            archetypes: Dict[str, Dict] = {}
+            counts = Counter()
+            for profile in profiles:
+                text = user_insight_profile_text(profile)
+                counts[text] += 1
+                archetypes.setdefault(text, profile)
+            for text, _ in counts.most_common(top_archetypes):
+                prompts.append(format_user_insight_prompt(archetypes[text]))
+                coros.append(self.generate_user_insight(archetypes[text]))
+        if settings.COLD_START_DYNAMIC_QUESTIONS:
+            prompts.append(COLD_START_QUESTIONS_PROMPT)
+            coros.append(self.generate_cold_start_questions())
+        
+        await gather_bounded(coros)
+        # Fallback answers (Groq errors) are not cached, so this counts real responses
+        return sum(
+            get_cached_llm_response(xxhash.xxh3_128_digest(prompt.encode())) is not None
+            for prompt in prompts
+        )
+    
     async def understand_query(self, query: str) -> Dict:
         """
         Extract structured information from natural language query.
@@ -175,11 +576,14 @@ class LLMService:
         prompt = format_query_understanding_prompt(query)
         
         try:
-            response = await self._call_llm(prompt, use_advanced=False)
+            response = await self._call_llm(
+                prompt, use_advanced=False,
+                semantic_scope='query_understanding', semantic_text=query
+            )
             # Parse JSON response
-            parsed = json.loads(response)
+            parsed = orjson.loads(response)
             return parsed
-        except json.JSONDecodeError:
+        except orjson.JSONDecodeError:
             # Fallback to basic parsing
             return {
                 "category": None,
@@ -202,28 +606,29 @@ class LLMService:
             Explanation text
         """
         prompt = format_search_explanation_prompt(query, product)
-        explanation = await self._call_llm(prompt, use_advanced=False)
+        explanation = await self._call_llm_coalesced('search_explanation', prompt)
         return explanation
     
     async def generate_cold_start_questions(self) -> List[str]:
         """
         Generate questions to ask new users for cold-start.
         
+        Returns the curated static questions unless dynamic (LLM-generated)
+        questions are enabled, e.g. for A/B testing.
+        
         Returns:
             List of questions
         """
+        if not settings.COLD_START_DYNAMIC_QUESTIONS:
+            return list(COLD_START_QUESTIONS)
+        
         try:
             response = await self._call_llm(COLD_START_QUESTIONS_PROMPT, use_advanced=False)
-            questions = json.loads(response)
+            questions = orjson.loads(response)
             return questions
-        except json.JSONDecodeError:
+        except orjson.JSONDecodeError:
             # Fallback questions
-            return [
-                "What type of products are you interested in?",
-                "What's your typical budget range?",
-                "Are you shopping for yourself or as a gift?",
-                "Do you prefer trendy or classic styles?"
-            ]
+            return list(COLD_START_QUESTIONS)
     
     async def generate_cold_start_recommendations(self, user_responses: Dict,
                                                   available_categories: List[str],
@@ -240,19 +645,19 @@ class LLMService:
             List of recommendation dicts with category, reasoning, priority
         """
         prompt = COLD_START_REASONING_PROMPT.format(
-            user_responses=json.dumps(user_responses, indent=2),
+            user_responses=orjson.dumps(user_responses, option=orjson.OPT_INDENT_2).decode(),
             available_categories=', '.join(available_categories),
-            popular_products=json.dumps([
+            popular_products=orjson.dumps([
                 f"{p['name']} (£{p['price']}, {p['category']})"
                 for p in popular_products[:10]
-            ], indent=2)
+            ], option=orjson.OPT_INDENT_2).decode()
         )
         
         try:
             response = await self._call_llm(prompt, use_advanced=True, max_tokens=300)
-            recommendations = json.loads(response)
+            recommendations = orjson.loads(response)
             return recommendations
-        except json.JSONDecodeError:
+        except orjson.JSONDecodeError:
             # Fallback to popular products
             return [
                 {
@@ -2,16 +2,21 @@
 LLM prompt templates for recommendations, explanations, and cold-start.
 Optimized for concise, relevant responses.
 """
+import bisect
+from string import Formatter
+
+
+SYSTEM_PROMPT = "You are a helpful e-commerce recommendation assistant. Provide concise, relevant responses."
 
 
 # User Insight Generation
 USER_INSIGHT_PROMPT = """Given a customer's shopping behavior, generate a concise 2-3 sentence insight.
 
 Customer Profile:
-- Total Spend: £{total_spend}
+- Total Spend: {total_spend}
 - Number of Purchases: {purchase_count}
 - Top Categories: {top_categories}
-- Average Order Value: £{avg_order_value}
+- Average Order Value: {avg_order_value}
 - Price Sensitivity: {price_sensitivity}
 
 Provide insight about:
@@ -22,6 +27,15 @@ Provide insight about:
 Keep it concise and actionable."""
 
 
+# The insight prompt reports these bands instead of exact figures, so
+# customers in the same bands share one cached insight and none is shown
+# another customer's numbers: (upper bounds, labels), one more label than
+# bounds for values above the last bound
+INSIGHT_SPEND_BANDS = ((250, 1000, 5000), ('under £250', '£250-£1,000', '£1,000-£5,000', 'over £5,000'))
+INSIGHT_PURCHASE_BANDS = ((20, 100, 500), ('under 20', '20-100', '100-500', 'over 500'))
+INSIGHT_ORDER_VALUE_BANDS = ((10, 25, 75), ('under £10', '£10-£25', '£25-£75', 'over £75'))
+
+
 # Recommendation Explanation
 RECOMMENDATION_EXPLANATION_PROMPT = """Explain in 1-2 sentences why we recommend this product to the customer.
 
@@ -39,6 +53,28 @@ Match Score: {match_score:.2f}
 Provide a brief, compelling explanation focusing on relevance to their interests."""
 
 
+# Segment-level Explanation (offline batch precompute)
+SEGMENT_EXPLANATION_PROMPT = """Explain in 1-2 sentences why we recommend this product to a customer segment.
+
+Product: {product_name}
+Category: {product_category}
+Price: £{product_price}
+
+Customer Segment:
+- Favourite Category: {user_category}
+- Price Sensitivity: {price_sensitivity}
+
+Provide a brief, compelling explanation focusing on relevance to their interests."""
+
+
+# Composite prompt: several independent single-answer prompts in one call
+COMPOSITE_PROMPT = """Answer each of the following {count} requests independently.
+
+{requests}
+
+Return only a JSON array of {count} strings: the answer to each request, in order."""
+
+
 # Natural Language Query Understanding
 QUERY_UNDERSTANDING_PROMPT = """Extract structured information from this product search query.
 
@@ -57,7 +93,15 @@ Return a JSON object with:
 Only return the JSON, no additional text."""
 
 
-# Cold Start - Initial Questions
+# Cold Start - Initial Questions (static; the LLM prompt below is only
+# used when COLD_START_DYNAMIC_QUESTIONS is enabled)
+COLD_START_QUESTIONS = (
+    "What type of products are you interested in?",
+    "What's your typical budget range?",
+    "Are you shopping for yourself or as a gift?",
+    "Do you prefer trendy or classic styles?"
+)
+
 COLD_START_QUESTIONS_PROMPT = """A new customer has no purchase history. Generate 3-4 brief questions to understand their preferences.
 
 Focus on:
@@ -120,20 +164,76 @@ For each product, provide a 1-sentence explanation. Return as JSON array:
 ]"""
 
 
-def format_user_insight_prompt(user_profile: dict) -> str:
-    """Format user insight prompt with profile data."""
-    return USER_INSIGHT_PROMPT.format(
-        total_spend=user_profile.get('total_spend', 0),
-        purchase_count=user_profile.get('purchase_count', 0),
+def _compile_template(template: str) -> tuple:
+    """Pre-split a format template into (literal, field, format_spec) parts."""
+    return tuple(
+        (literal, field, spec)
+        for literal, field, spec, _ in Formatter().parse(template)
+    )
+
+
+def _render(parts: tuple, values: dict) -> str:
+    """Render pre-split template parts without re-parsing the template."""
+    out = []
+    for literal, field, spec in parts:
+        out.append(literal)
+        if field is not None:
+            out.append(format(values[field], spec))
+    return ''.join(out)
+
+
+# Templates parsed once at import
+_USER_INSIGHT_PARTS = _compile_template(USER_INSIGHT_PROMPT)
+_RECOMMENDATION_EXPLANATION_PARTS = _compile_template(RECOMMENDATION_EXPLANATION_PROMPT)
+_SEGMENT_EXPLANATION_PARTS = _compile_template(SEGMENT_EXPLANATION_PROMPT)
+_COMPOSITE_PARTS = _compile_template(COMPOSITE_PROMPT)
+_QUERY_UNDERSTANDING_PARTS = _compile_template(QUERY_UNDERSTANDING_PROMPT)
+_SEARCH_EXPLANATION_PARTS = _compile_template(SEARCH_EXPLANATION_PROMPT)
+# Batch template split around the product list, which is joined in directly
+_BATCH_PREFIX, _BATCH_SUFFIX = BATCH_EXPLANATION_PROMPT.split("{products_list}")
+_BATCH_PREFIX_PARTS = _compile_template(_BATCH_PREFIX)
+_BATCH_SUFFIX = _render(_compile_template(_BATCH_SUFFIX), {})  # unescape braces
+
+
+def _band(value: float, bands: tuple) -> str:
+    """Label of the band value falls in."""
+    bounds, labels = bands
+    return labels[bisect.bisect_right(bounds, value)]
+
+
+def _user_insight_fields(user_profile: dict) -> dict:
+    """User insight template values, with spend and activity banded."""
+    return dict(
+        total_spend=_band(user_profile.get('total_spend', 0), INSIGHT_SPEND_BANDS),
+        purchase_count=_band(user_profile.get('purchase_count', 0), INSIGHT_PURCHASE_BANDS),
         top_categories=', '.join(user_profile.get('top_categories', [])),
-        avg_order_value=user_profile.get('avg_order_value', 0),
+        avg_order_value=_band(user_profile.get('avg_order_value', 0), INSIGHT_ORDER_VALUE_BANDS),
         price_sensitivity=user_profile.get('price_sensitivity', 'unknown')
     )
 
 
+def format_user_insight_prompt(user_profile: dict) -> str:
+    """Format user insight prompt with (banded) profile data."""
+    return _render(_USER_INSIGHT_PARTS, _user_insight_fields(user_profile))
+
+
+def user_insight_profile_text(user_profile: dict) -> str:
+    """
+    Variable part of the user insight prompt, for semantic caching. Built
+    from the same banded values the prompt shows, so a semantic hit is an
+    insight written from figures this customer shares.
+    """
+    fields = _user_insight_fields(user_profile)
+    return (
+        f"{fields['top_categories']}; {fields['price_sensitivity']} price sensitivity; "
+        f"spend {fields['total_spend']}; purchases {fields['purchase_count']}; "
+        f"order value {fields['avg_order_value']}"
+    )
+
+
 def format_recommendation_explanation_prompt(product: dict, user_profile: dict, match_score: float) -> str:
     """Format recommendation explanation prompt."""
-    return RECOMMENDATION_EXPLANATION_PROMPT.format(
+    return _render(_RECOMMENDATION_EXPLANATION_PARTS, dict(
         product_name=product.get('product_name', ''),
         product_category=product.get('category', ''),
         product_price=product.get('price', 0),
@@ -141,33 +241,60 @@ def format_recommendation_explanation_prompt(product: dict, user_profile: dict,
         user_avg_price=user_profile.get('avg_price', 0),
         price_sensitivity=user_profile.get('price_sensitivity', 'unknown'),
         match_score=match_score
-    )
+    ))
+
+
+def user_segment(user_profile: dict):
+    """Segment key (favourite category | price sensitivity), or None if unknown."""
+    top_categories = user_profile.get('top_categories')
+    if not top_categories:
+        return None
+    return f"{top_categories[0]}|{user_profile.get('price_sensitivity', 'unknown')}"
+
+
+def format_segment_explanation_prompt(segment: str, product: dict) -> str:
+    """Format segment explanation prompt for a (segment, product) pair."""
+    user_category, price_sensitivity = segment.rsplit('|', 1)
+    return _render(_SEGMENT_EXPLANATION_PARTS, dict(
+        product_name=product.get('product_name', ''),
+        product_category=product.get('category', ''),
+        product_price=product.get('price', 0),
+        user_category=user_category,
+        price_sensitivity=price_sensitivity
+    ))
+
+
+def format_composite_prompt(prompts: list) -> str:
+    """Format several prompts as one numbered composite request."""
+    return _render(_COMPOSITE_PARTS, dict(
+        count=len(prompts),
+        requests="\n\n".join(f"{i}) {prompt}" for i, prompt in enumerate(prompts, 1))
+    ))
 
 
 def format_query_understanding_prompt(query: str) -> str:
     """Format query understanding prompt."""
-    return QUERY_UNDERSTANDING_PROMPT.format(query=query)
+    return _render(_QUERY_UNDERSTANDING_PARTS, {'query': query})
 
 
 def format_search_explanation_prompt(query: str, product: dict) -> str:
     """Format search explanation prompt."""
-    return SEARCH_EXPLANATION_PROMPT.format(
+    return _render(_SEARCH_EXPLANATION_PARTS, dict(
         query=query,
         product_name=product.get('product_name', ''),
         category=product.get('category', ''),
         price=product.get('price', 0)
-    )
+    ))
 
 
 def format_batch_explanation_prompt(user_profile: dict, products: list) -> str:
     """Format batch explanation prompt for multiple products."""
-    products_list = "\n".join([
+    prefix = _render(_BATCH_PREFIX_PARTS, dict(
+        user_categories=', '.join(user_profile.get('top_categories', [])),
+        price_sensitivity=user_profile.get('price_sensitivity', 'unknown')
+    ))
+    product_lines = "\n".join([
         f"- {p.get('product_id')}: {p.get('product_name')} (£{p.get('price')}, {p.get('category')})"
         for p in products
     ])
-    
-    return BATCH_EXPLANATION_PROMPT.format(
-        user_categories=', '.join(user_profile.get('top_categories', [])),
-        price_sensitivity=user_profile.get('price_sensitivity', 'unknown'),
-        products_list=products_list
-    )
+    return "".join((prefix, product_lines, _BATCH_SUFFIX))
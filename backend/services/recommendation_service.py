@@ -2,8 +2,10 @@
 Recommendation Service - Core business logic for generating recommendations.
 Optimized for <500ms response time with caching and efficient model loading.
 """
+import asyncio
 import time
-from typing import List, Dict, Optional
+from typing import Any, AsyncIterator, List, Dict, Optional, Tuple
+import orjson
 from bson import ObjectId
 from backend.database import get_database
 from backend.cache import (
@@ -11,10 +13,39 @@ from backend.cache import (
     get_cached_user_profile, cache_user_profile
 )
 from backend.services.llm_service import llm_service
+from backend.services.prompts import user_segment
+from backend.middleware.request_context import request_profiles
 from ml_pipeline.hybrid_engine import HybridRecommender
 import os
 
 
+# Startup LLM cache warmup: user profiles sampled to find the most common
+# insight archetypes, and how many archetypes to pre-generate
+WARMUP_PROFILE_SAMPLE = 5000
+WARMUP_ARCHETYPES = 50
+
+
+def _profile_dict(profile: Dict) -> Dict:
+    """Service-level user profile from a user_profiles document."""
+    return {
+        'user_id': str(profile['user_id']),
+        'total_spend': profile.get('total_spend', 0),
+        'purchase_count': profile.get('purchase_frequency', 0) * 12,  # Approximate
+        'top_categories': profile.get('top_categories', []),
+        'avg_price': profile.get('avg_order_value', 0),
+        'avg_order_value': profile.get('avg_order_value', 0),
+        'price_sensitivity': profile.get('price_sensitivity', 'medium')
+    }
+
+
+def _sse_event(event: str, data: Any) -> bytes:
+    """Encode one server-sent event."""
+    return (
+        b"event: " + event.encode() + b"\ndata: "
+        + orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY) + b"\n\n"
+    )
+
+
 class RecommendationService:
     """
     High-performance recommendation service with caching and cold-start handling.
@@ -22,6 +53,7 @@ class RecommendationService:
     
     def __init__(self):
         self.recommender: Optional[HybridRecommender] = None
+        self._inflight: Dict[Tuple[str, int, bool], asyncio.Task] = {}
         self._load_recommender()
     
     def _load_recommender(self):
@@ -46,10 +78,7 @@ class RecommendationService:
         Returns:
             Dict with recommendations and metadata
         """
-        start_time = time.time()
-        
         # Check cache first
-        cache_key = f"{user_id}_{top_k}_{include_explanations}"
         cached = get_cached_recommendations(user_id)
         if cached and len(cached) >= top_k:
             return {
@@ -59,6 +88,23 @@ class RecommendationService:
                 'cached': True
             }
         
+        # Concurrent misses for the same request share one engine run and
+        # one explanation batch
+        key = (user_id, top_k, include_explanations)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(
+                self._generate_recommendations(user_id, top_k, include_explanations)
+            )
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+    
+    async def _generate_recommendations(self, user_id: str, top_k: int,
+                                        include_explanations: bool) -> Dict:
+        """Run the hybrid engine and explanations for a cache miss."""
+        start_time = time.time()
+        
         # Get recommendations from hybrid engine
         if not self.recommender:
             return self._cold_start_fallback(user_id, top_k)
@@ -87,7 +133,67 @@ class RecommendationService:
             'strategy': recommendations[0].get('method', 'unknown') if recommendations else 'none'
         }
     
+    async def stream_recommendations(self, user_id: str,
+                                     top_k: int = 10) -> AsyncIterator[bytes]:
+        """
+        Stream recommendations as server-sent events.
+        
+        Emits a `recommendations` event with the ranked list straight away,
+        then one `explanation` event per product as the LLM produces it,
+        then `done`.
+        """
+        start_time = time.time()
+        
+        cached = get_cached_recommendations(user_id)
+        if cached and len(cached) >= top_k:
+            yield _sse_event('recommendations', cached[:top_k])
+            yield _sse_event('done', {'processing_time_ms': 0, 'cached': True})
+            return
+        
+        if not self.recommender:
+            yield _sse_event('error', self._cold_start_fallback(user_id, top_k))
+            return
+        
+        recommendations = self.recommender.recommend(user_id, top_k=top_k)
+        yield _sse_event('recommendations', recommendations)
+        
+        if recommendations:
+            user_profile = await self._get_user_profile(user_id)
+            recs_by_id = {rec['product_id']: rec for rec in recommendations}
+            
+            async for product_id, explanation in llm_service.explain_recommendations_stream(
+                recommendations, user_profile
+            ):
+                rec = recs_by_id.get(product_id)
+                if rec is None or 'explanation' in rec:
+                    continue
+                rec['explanation'] = explanation
+                yield _sse_event('explanation', {
+                    'product_id': product_id, 'explanation': explanation
+                })
+            
+            cache_recommendations(user_id, recommendations)
+        
+        processing_time_ms = (time.time() - start_time) * 1000
+        yield _sse_event('done', {
+            'processing_time_ms': round(processing_time_ms, 2),
+            'cached': False
+        })
+    
     async def _get_user_profile(self, user_id: str) -> Dict:
+        """Get user profile, memoized for the current request."""
+        memo = request_profiles.get()
+        if memo is not None:
+            profile = memo.get(user_id)
+            if profile is not None:
+                return profile
+        
+        profile = await self._load_user_profile(user_id)
+        if memo is not None:
+            memo[user_id] = profile
+        return profile
+    
+    async def _load_user_profile(self, user_id: str) -> Dict:
         """Get or build user profile."""
         # Check cache
         cached_profile = get_cached_user_profile(user_id)
@@ -99,14 +205,7 @@ class RecommendationService:
         profile = await db.user_profiles.find_one({'user_id': ObjectId(user_id)})
         
         if profile:
-            profile_dict = {
-                'user_id': str(profile['user_id']),
-                'total_spend': profile.get('total_spend', 0),
-                'purchase_count': profile.get('purchase_frequency', 0) * 12,  # Approximate
-                'top_categories': profile.get('top_categories', []),
-                'avg_price': profile.get('avg_order_value', 0),
-                'price_sensitivity': profile.get('price_sensitivity', 'medium')
-            }
+            profile_dict = _profile_dict(profile)
             
             # Cache it
             cache_user_profile(user_id, profile_dict)
@@ -119,17 +218,34 @@ class RecommendationService:
             'purchase_count': 0,
             'top_categories': [],
             'avg_price': 0,
+            'avg_order_value': 0,
             'price_sensitivity': 'unknown'
         }
     
     async def _add_explanations(self, recommendations: List[Dict], 
                                user_profile: Dict) -> List[Dict]:
         """Add LLM-generated explanations to recommendations."""
-        # Use batch explanation for efficiency
         try:
-            explanations = await llm_service.explain_recommendations_batch(
-                recommendations, user_profile
-            )
+            # Explanations precomputed offline for the user's segment
+            explanations = {}
+            segment = user_segment(user_profile)
+            if segment:
+                db = get_database()
+                cursor = db.precomputed_explanations.find(
+                    {
+                        'segment': segment,
+                        'product_id': {'$in': [rec.get('product_id') for rec in recommendations]}
+                    },
+                    projection={'_id': 0, 'product_id': 1, 'explanation': 1}
+                )
+                explanations = {doc['product_id']: doc['explanation'] async for doc in cursor}
+            
+            # Use batch explanation for the rest
+            missing = [rec for rec in recommendations if rec.get('product_id') not in explanations]
+            if missing:
+                explanations.update(await llm_service.explain_recommendations_batch(
+                    missing, user_profile
+                ))
             
             for rec in recommendations:
                 product_id = rec.get('product_id')
@@ -145,6 +261,24 @@ class RecommendationService:
         
         return recommendations
     
+    async def warmup_llm_cache(self, sample_size: int = WARMUP_PROFILE_SAMPLE,
+                               top_archetypes: int = WARMUP_ARCHETYPES) -> None:
+        """Pre-generate user insights for the most common profile archetypes."""
+        db = get_database()
+        pipeline = [
+            {'$match': {'top_categories.0': {'$exists': True}, 'purchase_frequency': {'$gt': 0}}},
+            {'$sample': {'size': sample_size}},
+            {'$project': {'_id': 0, 'user_id': 1, 'total_spend': 1, 'purchase_frequency': 1,
+                          'top_categories': 1, 'avg_order_value': 1, 'price_sensitivity': 1}}
+        ]
+        
+        try:
+            docs = await db.user_profiles.aggregate(pipeline).to_list(length=None)
+            warmed = await llm_service.warmup([_profile_dict(doc) for doc in docs], top_archetypes)
+            print(f"✓ LLM cache warmed with {warmed} responses")
+        except Exception as e:
+            print(f"⚠ LLM cache warmup failed: {e}")
+    
     def _cold_start_fallback(self, user_id: str, top_k: int) -> Dict:
         """Fallback for when models aren't loaded."""
         return {
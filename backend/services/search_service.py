@@ -2,13 +2,19 @@
 Search Service - Natural language search with LLM query understanding.
 Optimized for <2s response time.
 """
+import asyncio
 import time
 from typing import List, Dict
 from backend.database import get_database
-from backend.services.llm_service import llm_service
+from backend.services.llm_service import llm_service, gather_bounded
 from ml_pipeline.embedding_generator import EmbeddingGenerator
 import os
 
+SEARCH_PROJECTION = {
+    '_id': 0, 'stock_code': 1, 'description': 1, 'category': 1,
+    'price': 1, 'popularity_score': 1
+}
+
 
 class SearchService:
     """
@@ -43,15 +49,19 @@ class SearchService:
         """
         start_time = time.time()
         
-        # Step 1: Understand query using LLM
-        query_understanding = await llm_service.understand_query(query)
+        # Steps 1 & 2 are independent: understand the query with the LLM
+        # while the embedding search runs off the event loop
+        query_understanding_task = asyncio.create_task(llm_service.understand_query(query))
         
-        # Step 2: Search using embeddings
         if self.embedding_gen:
-            semantic_results = self.embedding_gen.search_by_text(query, top_k=top_k * 2)
+            semantic_results = await asyncio.to_thread(
+                self.embedding_gen.search_by_text, query, top_k=top_k * 2
+            )
         else:
             semantic_results = []
         
+        query_understanding = await query_understanding_task
+        
         # Step 3: Filter by extracted criteria
         db = get_database()
         filtered_results = await self._filter_by_criteria(
@@ -76,25 +86,32 @@ class SearchService:
     async def _filter_by_criteria(self, semantic_results: List[tuple],
                                   criteria: Dict, db) -> List[Dict]:
         """Filter semantic search results by extracted criteria."""
-        filtered = []
+        if not semantic_results:
+            return []
+        
+        # One round-trip for all candidates, with the criteria pushed into
+        # the query so non-matching products never leave the server
+        query = {'stock_code': {'$in': [product_id for product_id, _ in semantic_results]}}
+        if criteria.get('category'):
+            query['category'] = criteria['category']
+        price_filter = {}
+        if criteria.get('max_price'):
+            price_filter['$lte'] = criteria['max_price']
+        if criteria.get('min_price'):
+            price_filter['$gte'] = criteria['min_price']
+        if price_filter:
+            query['price'] = price_filter
         
+        cursor = db.products.find(query, projection=SEARCH_PROJECTION)
+        products_by_id = {p['stock_code']: p async for p in cursor}
+        
+        # Keep semantic ranking order
+        filtered = []
         for product_id, distance in semantic_results:
-            # Get product from database
-            product = await db.products.find_one({'stock_code': product_id})
-            
+            product = products_by_id.get(product_id)
             if not product:
                 continue
             
-            # Apply filters
-            if criteria.get('category') and product.get('category') != criteria['category']:
-                continue
-            
-            if criteria.get('max_price') and product.get('price', 0) > criteria['max_price']:
-                continue
-            
-            if criteria.get('min_price') and product.get('price', 0) < criteria['min_price']:
-                continue
-            
             filtered.append({
                 'product_id': product['stock_code'],
                 'product_name': product['description'],
@@ -111,14 +128,16 @@ class SearchService:
         """Format and add explanations to search results."""
         formatted = []
         
-        for result in results:
+        # Generate explanations concurrently
+        explanations = await gather_bounded([
+            llm_service.explain_search_result(query, result) for result in results
+        ])
+        
+        for result, explanation in zip(results, explanations):
             # Calculate relevance score (lower distance = higher relevance)
             relevance_score = max(0, 1 - (result['semantic_distance'] / 10))
             
-            # Generate explanation
-            try:
-                explanation = await llm_service.explain_search_result(query, result)
-            except:
+            if isinstance(explanation, Exception):
                 explanation = f"Matches your search for {criteria.get('intent', query)}"
             
             formatted.append({
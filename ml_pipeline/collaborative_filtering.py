@@ -4,13 +4,84 @@ Optimized for sparse user-item matrices with 540K+ transactions.
 """
 import pandas as pd
 import numpy as np
-from surprise import SVD, Dataset, Reader
-from surprise.model_selection import cross_validate
+from numba import njit
+from surprise import SVD, Dataset, Reader, accuracy
+from surprise.model_selection import train_test_split
+from surprise.utils import get_rng
+from scipy import sparse
+from ml_pipeline.feature_engineering import UserItemMatrix, load_user_item_matrix
+from ml_pipeline.content_based_filtering import _top_k_indices
 import pickle
 import os
 from typing import List, Tuple
 
 
+@njit(cache=True)
+def _sgd(users, items, ratings, bu, bi, pu, qi, n_epochs, global_mean, biased,
+         lr_bu, lr_bi, lr_pu, lr_qi, reg_bu, reg_bi, reg_pu, reg_qi):
+    """Surprise's SVD SGD loop (BellKor updates), compiled. Updates arrays in place."""
+    n_factors = pu.shape[1]
+    for _ in range(n_epochs):
+        for k in range(ratings.shape[0]):
+            u = users[k]
+            i = items[k]
+            
+            # compute current error
+            dot = 0.0
+            for f in range(n_factors):
+                dot += qi[i, f] * pu[u, f]
+            err = ratings[k] - (global_mean + bu[u] + bi[i] + dot)
+            
+            # update biases
+            if biased:
+                bu[u] += lr_bu * (err - reg_bu * bu[u])
+                bi[i] += lr_bi * (err - reg_bi * bi[i])
+            
+            # update factors
+            for f in range(n_factors):
+                puf = pu[u, f]
+                qif = qi[i, f]
+                pu[u, f] += lr_pu * (err * qif - reg_pu * puf)
+                qi[i, f] += lr_qi * (err * puf - reg_qi * qif)
+
+
+class NumbaSVD(SVD):
+    """
+    surprise.SVD with the SGD training loop JIT-compiled by Numba.
+    Same hyperparameters, initialization and update order, so it learns
+    the same factors; everything else (predict, cross_validate) is Surprise.
+    """
+    
+    def sgd(self, trainset):
+        rng = get_rng(self.random_state)
+        
+        bu = np.zeros(trainset.n_users, dtype=np.double)
+        bi = np.zeros(trainset.n_items, dtype=np.double)
+        pu = rng.normal(self.init_mean, self.init_std_dev, size=(trainset.n_users, self.n_factors))
+        qi = rng.normal(self.init_mean, self.init_std_dev, size=(trainset.n_items, self.n_factors))
+        
+        # Flatten ratings once, in all_ratings() order
+        n_ratings = trainset.n_ratings
+        users = np.empty(n_ratings, dtype=np.int64)
+        items = np.empty(n_ratings, dtype=np.int64)
+        ratings = np.empty(n_ratings, dtype=np.double)
+        for k, (u, i, r) in enumerate(trainset.all_ratings()):
+            users[k] = u
+            items[k] = i
+            ratings[k] = r
+        
+        global_mean = self.trainset.global_mean if self.biased else 0.0
+        
+        _sgd(users, items, ratings, bu, bi, pu, qi, self.n_epochs, global_mean,
+             self.biased, self.lr_bu, self.lr_bi, self.lr_pu, self.lr_qi,
+             self.reg_bu, self.reg_bi, self.reg_pu, self.reg_qi)
+        
+        self.bu = bu
+        self.bi = bi
+        self.pu = pu
+        self.qi = qi
+
+
 class CollaborativeFilter:
     """
     SVD-based collaborative filtering for implicit feedback.
@@ -18,38 +89,43 @@ class CollaborativeFilter:
     """
     
     def __init__(self, n_factors=50, n_epochs=20):
-        self.model = SVD(n_factors=n_factors, n_epochs=n_epochs, random_state=42)
+        self.model = NumbaSVD(n_factors=n_factors, n_epochs=n_epochs, random_state=42)
         self.reader = Reader(rating_scale=(0, 100))  # Quantity-based ratings
         self.trained = False
-        self.user_item_df = None
+        # Purchased (user, product) cells as CSR, instead of the dense matrix
+        self.purchased = None  # Columns are the model's inner item ids
+        self.user_index = None  # user_id -> CSR row
         
-    def prepare_data(self, user_item_matrix: pd.DataFrame) -> Dataset:
+    def prepare_data(self, user_item_matrix: UserItemMatrix) -> Dataset:
         """Convert user-item matrix to Surprise Dataset format."""
         print("Preparing data for collaborative filtering...")
         
-        # Convert to long format
-        data_list = []
-        for user_id in user_item_matrix.index:
-            for product_id in user_item_matrix.columns:
-                rating = user_item_matrix.loc[user_id, product_id]
-                if rating > 0:  # Only include actual purchases
-                    # Normalize rating to 0-100 scale
-                    normalized_rating = min(rating * 10, 100)
-                    data_list.append([str(user_id), str(product_id), normalized_rating])
-        
-        df = pd.DataFrame(data_list, columns=['user_id', 'product_id', 'rating'])
+        # Convert to long format: the stored (purchased) cells, row-major
+        matrix = user_item_matrix.matrix.tocoo()
+        purchased = matrix.data > 0  # Only include actual purchases
+        rows, cols = matrix.row[purchased], matrix.col[purchased]
+        
+        df = pd.DataFrame({
+            'user_id': user_item_matrix.user_ids[rows].astype(str),
+            'product_id': user_item_matrix.product_ids[cols].astype(str),
+            # Normalize rating to 0-100 scale
+            'rating': np.minimum(matrix.data[purchased] * 10, 100)
+        })
         print(f"✓ Prepared {len(df):,} interactions for training")
         
         dataset = Dataset.load_from_df(df[['user_id', 'product_id', 'rating']], self.reader)
         return dataset
     
-    def train(self, user_item_matrix: pd.DataFrame):
+    def train(self, user_item_matrix: UserItemMatrix):
         """Train SVD model on user-item interactions."""
         print("\n" + "="*60)
         print("TRAINING COLLABORATIVE FILTERING MODEL")
         print("="*60 + "\n")
         
-        self.user_item_df = user_item_matrix
+        self.purchased = sparse.csr_matrix(user_item_matrix.matrix > 0)
+        self.user_index = {
+            user_id: row for row, user_id in enumerate(user_item_matrix.user_ids.astype(str))
+        }
         dataset = self.prepare_data(user_item_matrix)
         
         # Train on full dataset
@@ -59,13 +135,31 @@ class CollaborativeFilter:
         self.model.fit(trainset)
         self.trained = True
         
+        # Re-key purchased columns to inner item ids so prediction can filter
+        # in integer space (every purchased product is in the trainset)
+        inner_items = np.fromiter(
+            (trainset._raw2inner_id_items.get(product_id, -1)
+             for product_id in user_item_matrix.product_ids.astype(str)),
+            dtype=np.int64, count=len(user_item_matrix.product_ids)
+        )
+        self.purchased.indices = inner_items[self.purchased.indices].astype(
+            self.purchased.indices.dtype
+        )
+        self.purchased.has_sorted_indices = False
+        
         print("✓ Model trained successfully")
         
-        # Cross-validation for evaluation
-        print("\nEvaluating model with cross-validation...")
-        cv_results = cross_validate(self.model, dataset, measures=['RMSE', 'MAE'], cv=3, verbose=False)
-        print(f"  RMSE: {cv_results['test_rmse'].mean():.2f}")
-        print(f"  MAE:  {cv_results['test_mae'].mean():.2f}")
+        # Single 90/10 holdout for evaluation, on a separate model so the
+        # full-data model above is left untouched
+        print("\nEvaluating model on a 10% holdout...")
+        eval_trainset, eval_testset = train_test_split(dataset, test_size=0.1, random_state=42)
+        eval_model = NumbaSVD(
+            n_factors=self.model.n_factors, n_epochs=self.model.n_epochs, random_state=42
+        )
+        eval_model.fit(eval_trainset)
+        predictions = eval_model.test(eval_testset)
+        print(f"  RMSE: {accuracy.rmse(predictions, verbose=False):.2f}")
+        print(f"  MAE:  {accuracy.mae(predictions, verbose=False):.2f}")
         
         print("\n" + "="*60)
         print("✓ COLLABORATIVE FILTERING TRAINING COMPLETE")
@@ -86,24 +180,43 @@ class CollaborativeFilter:
         if not self.trained:
             raise ValueError("Model not trained yet")
         
+        trainset = self.model.trainset
+        product_ids = np.asarray([str(product_id) for product_id in product_ids], dtype=object)
+        
+        # Map candidates to inner item ids (-1 = unknown to the model)
+        items = np.fromiter(
+            (trainset._raw2inner_id_items.get(product_id, -1) for product_id in product_ids),
+            dtype=np.int64, count=len(product_ids)
+        )
+        
         # Get products user hasn't purchased
-        if str(user_id) in self.user_item_df.index:
-            purchased_products = set(
-                self.user_item_df.columns[self.user_item_df.loc[str(user_id)] > 0]
-            )
-        else:
-            purchased_products = set()
-        
-        # Predict scores for all products
-        predictions = []
-        for product_id in product_ids:
-            if str(product_id) not in purchased_products:
-                pred = self.model.predict(str(user_id), str(product_id))
-                predictions.append((str(product_id), pred.est))
-        
-        # Sort by score and return top-k
-        predictions.sort(key=lambda x: x[1], reverse=True)
-        return predictions[:top_k]
+        row = self.user_index.get(str(user_id))
+        if row is not None:
+            start, end = self.purchased.indptr[row], self.purchased.indptr[row + 1]
+            not_purchased = ~np.isin(items, self.purchased.indices[start:end])
+            product_ids = product_ids[not_purchased]
+            items = items[not_purchased]
+        if len(product_ids) == 0:
+            return []
+        
+        # Score all candidates at once, exactly as SVD.predict would:
+        # global mean + user bias + item bias + <qi, pu>, clipped to the
+        # rating scale, with unknown users/items contributing nothing
+        known = items >= 0
+        known_items = items[known]
+        
+        scores = np.full(len(product_ids), trainset.global_mean)
+        scores[known] += self.model.bi[known_items]
+        inner_uid = trainset._raw2inner_id_users.get(str(user_id))
+        if inner_uid is not None:
+            scores += self.model.bu[inner_uid]
+            scores[known] += self.model.qi[known_items] @ self.model.pu[inner_uid]
+        np.clip(scores, *trainset.rating_scale, out=scores)
+        
+        # Top-k by score (ties keep input order)
+        top = _top_k_indices(scores, top_k)
+        
+        return [(product_ids[i], float(scores[i])) for i in top]
     
     def save_model(self, path: str = 'models/collaborative_filter.pkl'):
         """Save trained model to disk."""
@@ -124,7 +237,7 @@ class CollaborativeFilter:
 if __name__ == "__main__":
     # Load user-item matrix
     print("Loading user-item matrix...")
-    user_item_matrix = pd.read_csv('data/features/user_item_matrix.csv', index_col=0)
+    user_item_matrix = load_user_item_matrix()
     
     # Train model
     cf = CollaborativeFilter(n_factors=50, n_epochs=20)
@@ -134,8 +247,8 @@ if __name__ == "__main__":
     cf.save_model()
     
     # Test prediction
-    test_user = user_item_matrix.index[0]
-    test_products = user_item_matrix.columns[:100].tolist()
+    test_user = user_item_matrix.user_ids[0]
+    test_products = user_item_matrix.product_ids[:100].tolist()
     recommendations = cf.predict_for_user(test_user, test_products, top_k=10)
     
     print(f"\nTest recommendations for user {test_user}:")
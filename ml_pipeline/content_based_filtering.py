@@ -4,11 +4,57 @@ Fast and effective for product recommendations based on features.
 """
 import pandas as pd
 import numpy as np
+from numba import njit, prange
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
 import pickle
 import os
 from typing import List, Tuple, Dict
+from ml_pipeline.feature_engineering import PRODUCTS_PATH
+
+
+SIMILARITY_BLOCK_ROWS = 1024  # Rows per kernel call when precomputing similarity
+
+
+def _packed_offset(row, n):
+    """Start of a row in a row-packed upper triangle (diagonal included) of an n x n matrix."""
+    return row * n - row * (row - 1) // 2
+
+
+@njit(parallel=True, cache=True)
+def _sparse_self_similarity(indptr, indices, data, col_indptr, col_rows, col_data,
+                            start, stop, out):
+    """
+    Fill out with rows start..stop of the upper triangle of X @ X.T, row-packed,
+    for an L2-normalized CSR matrix X (cosine similarity).
+    
+    Row i accumulates only over products j >= i that share a term with it,
+    found through the CSC copy of X (col_*).
+    """
+    n = len(indptr) - 1
+    base = start * n - start * (start - 1) // 2
+    for i in prange(start, stop):
+        row = i * n - i * (i - 1) // 2 - base - i
+        for k in range(indptr[i], indptr[i + 1]):
+            term = indices[k]
+            weight = data[k]
+            for m in range(col_indptr[term], col_indptr[term + 1]):
+                j = col_rows[m]
+                if j >= i:
+                    out[row + j] += weight * col_data[m]
+
+
+def _top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """Indices of the top_k highest scores, best first (ties keep index order)."""
+    if len(scores) > top_k:
+        # Everything above the k-th score, then the earliest items tied with it
+        kth = -np.partition(-scores, top_k - 1)[top_k - 1]
+        above = np.flatnonzero(scores > kth)
+        tied = np.flatnonzero(scores == kth)[:top_k - len(above)]
+        top = np.concatenate((above, tied))
+    else:
+        top = np.arange(len(scores))
+    return top[np.lexsort((top, -scores[top]))]
 
 
 class ContentBasedFilter:
@@ -21,18 +67,23 @@ class ContentBasedFilter:
         self.vectorizer = TfidfVectorizer(
             max_features=500,
             stop_words='english',
-            ngram_range=(1, 2)
+            ngram_range=(1, 2),
+            dtype=np.float32
         )
         self.product_vectors = None
         self.products_df = None
+        self.product_codes = None
+        self.product_index = None
         self.similarity_matrix = None
         
-    def train(self, products_df: pd.DataFrame):
+    def train(self, products_df: pd.DataFrame, precompute_similarity: bool = False):
         """
         Train content-based model on product metadata.
         
         Args:
             products_df: DataFrame with columns: stock_code, description, category, price
+            precompute_similarity: Also store the product similarity matrix
+                (float16 upper triangle, N^2 bytes) instead of computing rows on demand
         """
         print("\n" + "="*60)
         print("TRAINING CONTENT-BASED FILTERING MODEL")
@@ -40,6 +91,10 @@ class ContentBasedFilter:
         
         self.products_df = products_df.copy()
         
+        # Row position of each stock code, for O(1) product lookups
+        self.product_codes = self.products_df['stock_code'].to_numpy()
+        self.product_index = {code: i for i, code in enumerate(self.product_codes)}
+        
         # Create combined text features
         print("Creating product feature vectors...")
         self.products_df['combined_features'] = (
@@ -48,23 +103,66 @@ class ContentBasedFilter:
             self.products_df['category']  # Weight category more
         )
         
-        # Create TF-IDF vectors
-        self.product_vectors = self.vectorizer.fit_transform(
-            self.products_df['combined_features']
+        # Create L2-normalized TF-IDF vectors so a sparse dot product is the
+        # cosine similarity; unless precomputed, rows are computed on demand
+        self.product_vectors = normalize(
+            self.vectorizer.fit_transform(self.products_df['combined_features']),
+            norm='l2'
         )
         
         print(f"✓ Created TF-IDF vectors: {self.product_vectors.shape}")
         
-        # Precompute similarity matrix for faster recommendations
-        print("Computing product similarity matrix...")
-        self.similarity_matrix = cosine_similarity(self.product_vectors)
-        
-        print(f"✓ Similarity matrix computed: {self.similarity_matrix.shape}")
+        if precompute_similarity:
+            print("Computing product similarity matrix...")
+            self.similarity_matrix = self._compute_similarity_matrix()
+            print(f"✓ Similarity matrix computed: {self.similarity_matrix.nbytes / 1e6:.1f} MB")
         
         print("\n" + "="*60)
         print("✓ CONTENT-BASED FILTERING TRAINING COMPLETE")
         print("="*60 + "\n")
     
+    def _compute_similarity_matrix(self) -> np.ndarray:
+        """
+        Cosine similarity of all product pairs with the Numba sparse kernel.
+        The matrix is symmetric, so only its upper triangle is kept, row-packed
+        as float16 (ample precision for ranking similarities in [0, 1]).
+        """
+        vectors = self.product_vectors.tocsr()
+        columns = vectors.tocsc()
+        n = vectors.shape[0]
+        packed = np.empty(_packed_offset(n, n), dtype=np.float16)
+        for start in range(0, n, SIMILARITY_BLOCK_ROWS):
+            stop = min(n, start + SIMILARITY_BLOCK_ROWS)
+            begin, end = _packed_offset(start, n), _packed_offset(stop, n)
+            block = np.zeros(end - begin, dtype=np.float32)
+            _sparse_self_similarity(
+                vectors.indptr, vectors.indices, vectors.data,
+                columns.indptr, columns.indices, columns.data, start, stop, block
+            )
+            packed[begin:end] = block
+        return packed
+    
+    def _positions(self, product_ids: List[str]) -> List[int]:
+        """Row positions of the known products among product_ids."""
+        return [
+            self.product_index[product_id]
+            for product_id in product_ids
+            if product_id in self.product_index
+        ]
+    
+    def _similarity_row(self, idx: int) -> np.ndarray:
+        """Similarity of one product to every product."""
+        if self.similarity_matrix is not None:
+            # Entries left of the diagonal are read down column idx
+            n = len(self.product_codes)
+            before = np.arange(idx)
+            row = np.empty(n, dtype=np.float32)
+            row[:idx] = self.similarity_matrix[_packed_offset(before, n) + idx - before]
+            start = _packed_offset(idx, n)
+            row[idx:] = self.similarity_matrix[start:start + n - idx]
+            return row
+        return (self.product_vectors @ self.product_vectors[idx].T).toarray().ravel()
+    
     def get_similar_products(self, product_id: str, top_k: int = 10) -> List[Tuple[str, float]]:
         """
         Get products similar to a given product.
@@ -76,22 +174,19 @@ class ContentBasedFilter:
         Returns:
             List of (product_id, similarity_score) tuples
         """
-        if product_id not in self.products_df['stock_code'].values:
-            return []
-        
         # Get index of the product
-        idx = self.products_df[self.products_df['stock_code'] == product_id].index[0]
-        
-        # Get similarity scores
-        sim_scores = list(enumerate(self.similarity_matrix[idx]))
+        idx = self.product_index.get(product_id)
+        if idx is None:
+            return []
         
-        # Sort by similarity (excluding the product itself)
-        sim_scores = sorted(sim_scores, key=lambda x: x[1], reverse=True)[1:top_k+1]
+        # Get similarity scores (excluding the product itself)
+        sim_scores = np.array(self._similarity_row(idx), dtype=np.float64)
+        sim_scores[idx] = -np.inf
         
-        # Get product IDs and scores
+        # Get product IDs and scores of the most similar products
         recommendations = [
-            (self.products_df.iloc[i]['stock_code'], score)
-            for i, score in sim_scores
+            (self.product_codes[i], float(sim_scores[i]))
+            for i in _top_k_indices(sim_scores, min(top_k, len(sim_scores) - 1))
         ]
         
         return recommendations
@@ -115,35 +210,36 @@ class ContentBasedFilter:
             return self._get_popular_products(top_k)
         
         # Get indices of purchased products
-        purchased_indices = []
-        for product_id in user_purchase_history:
-            if product_id in self.products_df['stock_code'].values:
-                idx = self.products_df[self.products_df['stock_code'] == product_id].index[0]
-                purchased_indices.append(idx)
+        purchased_indices = self._positions(user_purchase_history)
         
         if not purchased_indices:
             return self._get_popular_products(top_k)
         
-        # Compute average similarity to purchased products
-        avg_similarity = self.similarity_matrix[purchased_indices].mean(axis=0)
+        # Candidates in catalog order, excluding already purchased
+        candidates = np.zeros(len(self.product_codes), dtype=bool)
+        candidates[self._positions(all_products)] = True
+        candidates[purchased_indices] = False
+        candidates = np.flatnonzero(candidates)
         
-        # Create recommendations excluding already purchased
-        recommendations = []
-        for idx, score in enumerate(avg_similarity):
-            product_id = self.products_df.iloc[idx]['stock_code']
-            if product_id not in user_purchase_history and product_id in all_products:
-                recommendations.append((product_id, float(score)))
+        # Average similarity of each candidate to the purchased products
+        if self.similarity_matrix is not None:
+            avg_similarity = np.mean([self._similarity_row(i) for i in purchased_indices], axis=0)
+            scores = avg_similarity[candidates]
+        else:
+            query = self.product_vectors[purchased_indices].mean(axis=0)
+            scores = np.asarray(self.product_vectors @ query.T).ravel()[candidates]
         
-        # Sort by score and return top-k
-        recommendations.sort(key=lambda x: x[1], reverse=True)
-        return recommendations[:top_k]
+        return [
+            (self.product_codes[candidates[i]], float(scores[i]))
+            for i in _top_k_indices(scores, min(top_k, len(candidates)))
+        ]
     
     def _get_popular_products(self, top_k: int) -> List[Tuple[str, float]]:
         """Get most popular products as fallback."""
-        top_products = self.products_df.nlargest(top_k, 'popularity_score')
+        popularity = self.products_df['popularity_score'].to_numpy()
         return [
-            (row['stock_code'], row['popularity_score'] / 100)
-            for _, row in top_products.iterrows()
+            (self.product_codes[i], popularity[i] / 100)
+            for i in _top_k_indices(popularity, top_k)
         ]
     
     def save_model(self, path: str = 'models/content_based_filter.pkl'):
@@ -165,7 +261,7 @@ class ContentBasedFilter:
 if __name__ == "__main__":
     # Load product metadata
     print("Loading product metadata...")
-    products_df = pd.read_csv('data/features/products.csv')
+    products_df = pd.read_parquet(PRODUCTS_PATH)
     
     # Train model
     cbf = ContentBasedFilter()
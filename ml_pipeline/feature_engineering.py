@@ -6,65 +6,145 @@ import pandas as pd
 import numpy as np
 from datetime import datetime
 from collections import Counter
-from typing import Dict, List
+from joblib import Parallel, delayed, effective_n_jobs
+from numba import njit
+from scipy import sparse
+from typing import Dict, List, NamedTuple
 
 
-def build_user_profiles(df: pd.DataFrame) -> pd.DataFrame:
+USER_PROFILES_PATH = 'data/features/user_profiles.parquet'
+USER_CATEGORIES_PATH = 'data/features/user_categories.parquet'
+USER_BRANDS_PATH = 'data/features/user_brands.parquet'
+PRODUCTS_PATH = 'data/features/products.parquet'
+USER_ITEM_MATRIX_PATH = 'data/features/user_item_matrix.npz'
+
+
+class UserItemMatrix(NamedTuple):
+    """Sparse users x products purchase quantities with their row/column labels."""
+    matrix: sparse.csr_matrix
+    user_ids: np.ndarray  # Row -> Customer ID
+    product_ids: np.ndarray  # Column -> StockCode
+
+
+class UserProfiles(NamedTuple):
+    """Per-customer profile scalars, with top categories and brand affinity as tall tables."""
+    profiles: pd.DataFrame  # One row per customer
+    categories: pd.DataFrame  # customer_id, category; best first per customer
+    brands: pd.DataFrame  # customer_id, brand, affinity; best first per customer
+
+
+def _top_values(customer_ids: pd.Series, values: pd.Series, top_n: int) -> pd.DataFrame:
+    """
+    Most frequent values per customer, like per-customer value_counts().head(top_n):
+    ranked by count, ties kept in order of first appearance.
+    
+    Returns:
+        DataFrame with columns customer_id, value, count
+    """
+    # Count (customer, value) pairs on integer codes; pairs are numbered in
+    # order of first appearance, which breaks count ties
+    customer_codes, customers = pd.factorize(customer_ids, sort=True)
+    value_codes, value_uniques = pd.factorize(values)
+    pair_codes, pairs = pd.factorize(
+        customer_codes.astype(np.int64) * len(value_uniques) + value_codes
+    )
+    counts = np.bincount(pair_codes)
+    pair_customers, pair_values = np.divmod(pairs, len(value_uniques))
+    
+    # Customer ascending, count descending (lexsort is stable), then the
+    # first top_n pairs of each customer
+    order = np.lexsort((-counts, pair_customers))
+    sorted_customers = pair_customers[order]
+    starts = np.flatnonzero(np.r_[True, sorted_customers[1:] != sorted_customers[:-1]])
+    rank = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+    top = rank < top_n
+    order = order[top]
+    
+    return pd.DataFrame({
+        'customer_id': customers.take(sorted_customers[top]),
+        'value': value_uniques.take(pair_values[order]),
+        'count': counts[order]
+    })
+
+
+def _build_profiles_chunk(df: pd.DataFrame) -> UserProfiles:
+    """Profiles for every customer in df (all of each customer's transactions)."""
+    # Per-customer aggregates in one grouped pass
+    stats = df.groupby('Customer ID').agg(
+        total_spend=('TotalAmount', 'sum'),
+        purchase_count=('TotalAmount', 'size'),
+        avg_price=('Price', 'mean'),
+        first_purchase=('InvoiceDate', 'min'),
+        last_purchase=('InvoiceDate', 'max')
+    )
+    
+    # Calculate spending metrics
+    avg_order_value = stats['total_spend'] / stats['purchase_count']
+    
+    # Calculate purchase frequency (purchases per month)
+    date_range = (stats['last_purchase'] - stats['first_purchase']).dt.days
+    months = np.maximum(date_range / 30, 1)  # At least 1 month
+    purchase_frequency = stats['purchase_count'] / months
+    
+    # Top categories
+    categories = _top_values(df['Customer ID'], df['Category'], 3)
+    top_categories = pd.DataFrame({
+        'customer_id': categories['customer_id'].to_numpy(),
+        'category': categories['value'].to_numpy()
+    })
+    
+    # Brand affinity (using StockCode prefix as proxy for brand)
+    brands = _top_values(df['Customer ID'], df['StockCode'].astype(str).str[:2], 5)
+    brand_affinity = pd.DataFrame({
+        'customer_id': brands['customer_id'].to_numpy(),
+        'brand': brands['value'].to_numpy(),
+        'affinity': brands['count'].to_numpy()
+        / stats['purchase_count'].reindex(brands['customer_id']).to_numpy()
+    })
+    
+    # Price sensitivity
+    price_sensitivity = np.select(
+        [stats['avg_price'] < 2, stats['avg_price'] < 5], ['high', 'medium'], default='low'
+    )
+    
+    profiles_df = pd.DataFrame({
+        'customer_id': stats.index,
+        'total_spend': stats['total_spend'].round(2).to_numpy(),
+        'purchase_count': stats['purchase_count'].to_numpy(),
+        'avg_order_value': avg_order_value.round(2).to_numpy(),
+        'purchase_frequency': purchase_frequency.round(2).to_numpy(),
+        'price_sensitivity': price_sensitivity,
+        'first_purchase': stats['first_purchase'].to_numpy(),
+        'last_purchase': stats['last_purchase'].to_numpy()
+    })
+    return UserProfiles(profiles_df, top_categories, brand_affinity)
+
+
+def build_user_profiles(df: pd.DataFrame, n_jobs: int = 1) -> UserProfiles:
     """
     Build comprehensive user profiles from transaction data.
     Critical for personalized recommendations.
+    
+    Args:
+        df: Cleaned transactions
+        n_jobs: Worker processes (-1 = all cores). The aggregation is
+            vectorized, so workers only pay off for very large inputs.
     """
     print("\nBuilding user profiles...")
     
-    user_profiles = []
-    
-    # Group by customer
-    for customer_id, group in df.groupby('Customer ID'):
-        # Calculate spending metrics
-        total_spend = group['TotalAmount'].sum()
-        purchase_count = len(group)
-        avg_order_value = total_spend / purchase_count
-        
-        # Calculate purchase frequency (purchases per month)
-        date_range = (group['InvoiceDate'].max() - group['InvoiceDate'].min()).days
-        months = max(date_range / 30, 1)  # At least 1 month
-        purchase_frequency = purchase_count / months
-        
-        # Top categories
-        category_counts = group['Category'].value_counts()
-        top_categories = category_counts.head(3).index.tolist()
-        
-        # Brand affinity (using StockCode prefix as proxy for brand)
-        stock_codes = group['StockCode'].astype(str)
-        brand_prefixes = stock_codes.str[:2].value_counts()
-        brand_affinity = {
-            brand: count / len(group) 
-            for brand, count in brand_prefixes.head(5).items()
-        }
-        
-        # Price sensitivity
-        avg_price = group['Price'].mean()
-        if avg_price < 2:
-            price_sensitivity = "high"
-        elif avg_price < 5:
-            price_sensitivity = "medium"
-        else:
-            price_sensitivity = "low"
-        
-        user_profiles.append({
-            'customer_id': customer_id,
-            'total_spend': round(total_spend, 2),
-            'purchase_count': purchase_count,
-            'avg_order_value': round(avg_order_value, 2),
-            'purchase_frequency': round(purchase_frequency, 2),
-            'top_categories': top_categories,
-            'brand_affinity': brand_affinity,
-            'price_sensitivity': price_sensitivity,
-            'first_purchase': group['InvoiceDate'].min(),
-            'last_purchase': group['InvoiceDate'].max()
-        })
-    
-    profiles_df = pd.DataFrame(user_profiles)
+    n_jobs = effective_n_jobs(n_jobs)
+    if n_jobs == 1:
+        user_profiles = _build_profiles_chunk(df)
+    else:
+        # One contiguous block of sorted customers per worker, so each worker
+        # gets a single sub-frame rather than one per customer
+        customer_ids = df['Customer ID'].drop_duplicates().sort_values().to_numpy()
+        parts = Parallel(n_jobs=n_jobs)(
+            delayed(_build_profiles_chunk)(df[df['Customer ID'].isin(chunk)])
+            for chunk in np.array_split(customer_ids, n_jobs)
+        )
+        user_profiles = UserProfiles(*[pd.concat(tables, ignore_index=True) for tables in zip(*parts)])
+    profiles_df = user_profiles.profiles
     
     print(f"✓ Created {len(profiles_df):,} user profiles")
     print(f"\nUser Profile Statistics:")
@@ -72,7 +152,62 @@ def build_user_profiles(df: pd.DataFrame) -> pd.DataFrame:
     print(f"  Avg purchases per user: {profiles_df['purchase_count'].mean():.1f}")
     print(f"  Avg order value: £{profiles_df['avg_order_value'].mean():.2f}")
     
-    return profiles_df
+    return user_profiles
+
+
+def _most_common(df: pd.DataFrame, column: str) -> pd.Series:
+    """
+    Mode of column per StockCode, like per-group Series.mode()[0]:
+    highest count, ties broken by the smallest value.
+    """
+    counts = df.groupby(['StockCode', column]).size().reset_index(name='count')
+    counts = counts.sort_values('count', ascending=False, kind='stable')
+    return counts.drop_duplicates('StockCode').set_index('StockCode')[column]
+
+
+@njit(cache=True)
+def _product_stats(product_codes, customer_codes, quantity, price, n_products, n_customers):
+    """
+    Total quantity, distinct customers and median price per product code,
+    in one pass over the transactions grouped by product.
+    """
+    # Counting sort of transaction rows by product
+    starts = np.zeros(n_products + 1, dtype=np.int64)
+    for p in product_codes:
+        starts[p + 1] += 1
+    starts = np.cumsum(starts)
+    order = np.empty(len(product_codes), dtype=np.int64)
+    fill = starts[:-1].copy()
+    for k in range(len(product_codes)):
+        p = product_codes[k]
+        order[fill[p]] = k
+        fill[p] += 1
+    
+    total_quantity = np.zeros(n_products, dtype=np.int64)
+    unique_customers = np.zeros(n_products, dtype=np.int64)
+    median_price = np.empty(n_products)
+    last_product = np.full(n_customers, -1, dtype=np.int64)  # Customer -> last product counted
+    prices = np.empty(len(product_codes))
+    for p in range(n_products):
+        n = 0
+        for i in range(starts[p], starts[p + 1]):
+            k = order[i]
+            total_quantity[p] += quantity[k]
+            c = customer_codes[k]
+            if last_product[c] != p:
+                last_product[c] = p
+                unique_customers[p] += 1
+            prices[n] = price[k]
+            n += 1
+        
+        mid = n // 2
+        partitioned = np.partition(prices[:n], mid)
+        if n % 2:
+            median_price[p] = partitioned[mid]
+        else:
+            median_price[p] = (partitioned[:mid].max() + partitioned[mid]) / 2
+    
+    return total_quantity, unique_customers, median_price
 
 
 def build_product_metadata(df: pd.DataFrame) -> pd.DataFrame:
@@ -82,35 +217,29 @@ def build_product_metadata(df: pd.DataFrame) -> pd.DataFrame:
     """
     print("\nBuilding product metadata...")
     
-    product_data = []
+    # Per-product aggregates in one compiled pass over integer codes
+    product_codes, stock_codes = pd.factorize(df['StockCode'], sort=True)
+    customer_codes, customer_ids = pd.factorize(df['Customer ID'])
+    total_quantity, unique_customers, median_price = _product_stats(
+        product_codes, customer_codes,
+        df['Quantity'].to_numpy(dtype=np.int64), df['Price'].to_numpy(dtype=np.float64),
+        len(stock_codes), len(customer_ids)
+    )
     
-    # Group by product
-    for stock_code, group in df.groupby('StockCode'):
-        # Get most common description (in case of variations)
-        description = group['Description'].mode()[0] if len(group['Description'].mode()) > 0 else group['Description'].iloc[0]
-        
-        # Category
-        category = group['Category'].mode()[0] if len(group['Category'].mode()) > 0 else group['Category'].iloc[0]
-        
+    # Popularity score (based on purchase frequency and quantity)
+    popularity_score = np.log1p(total_quantity) * np.log1p(unique_customers)
+    
+    products_df = pd.DataFrame({
+        'stock_code': stock_codes,
+        # Most common description/category (in case of variations)
+        'description': _most_common(df, 'Description').reindex(stock_codes).to_numpy(),
+        'category': _most_common(df, 'Category').reindex(stock_codes).to_numpy(),
         # Price (median to handle outliers)
-        price = group['Price'].median()
-        
-        # Popularity score (based on purchase frequency and quantity)
-        total_quantity = group['Quantity'].sum()
-        unique_customers = group['Customer ID'].nunique()
-        popularity_score = np.log1p(total_quantity) * np.log1p(unique_customers)
-        
-        product_data.append({
-            'stock_code': stock_code,
-            'description': description,
-            'category': category,
-            'price': round(price, 2),
-            'popularity_score': round(popularity_score, 2),
-            'total_sold': int(total_quantity),
-            'unique_buyers': unique_customers
-        })
-    
-    products_df = pd.DataFrame(product_data)
+        'price': np.round(median_price, 2),
+        'popularity_score': np.round(popularity_score, 2),
+        'total_sold': total_quantity,
+        'unique_buyers': unique_customers
+    })
     
     # Normalize popularity scores to 0-100
     max_pop = products_df['popularity_score'].max()
@@ -127,42 +256,66 @@ def build_product_metadata(df: pd.DataFrame) -> pd.DataFrame:
     return products_df
 
 
-def create_user_item_matrix(df: pd.DataFrame) -> pd.DataFrame:
+def create_user_item_matrix(df: pd.DataFrame) -> UserItemMatrix:
     """
     Create user-item interaction matrix for collaborative filtering.
-    Uses implicit feedback (purchase count).
+    Uses implicit feedback (purchase count), stored sparse: only purchased
+    cells take memory. Users and products are sorted by id.
     """
     print("\nCreating user-item interaction matrix...")
     
-    # Aggregate purchases per user-product pair
-    interactions = df.groupby(['Customer ID', 'StockCode']).agg({
-        'Quantity': 'sum',
-        'TotalAmount': 'sum'
-    }).reset_index()
-    
-    # Create pivot table
-    user_item_matrix = interactions.pivot_table(
-        index='Customer ID',
-        columns='StockCode',
-        values='Quantity',
-        fill_value=0
+    user_codes, user_ids = pd.factorize(df['Customer ID'], sort=True)
+    product_codes, product_ids = pd.factorize(df['StockCode'], sort=True)
+    
+    # Scatter every transaction into its cell; CSR conversion sums the
+    # repeated user-product pairs, so no groupby is needed
+    matrix = sparse.csr_matrix(
+        (df['Quantity'].to_numpy(dtype=np.float64), (user_codes, product_codes)),
+        shape=(len(user_ids), len(product_ids))
+    )
+    user_item_matrix = UserItemMatrix(
+        matrix, np.asarray(user_ids, dtype=str), np.asarray(product_ids, dtype=str)
     )
     
-    print(f"✓ Matrix shape: {user_item_matrix.shape[0]:,} users × {user_item_matrix.shape[1]:,} products")
-    print(f"  Sparsity: {(1 - user_item_matrix.astype(bool).sum().sum() / (user_item_matrix.shape[0] * user_item_matrix.shape[1])) * 100:.2f}%")
+    print(f"✓ Matrix shape: {matrix.shape[0]:,} users × {matrix.shape[1]:,} products")
+    print(f"  Sparsity: {(1 - matrix.nnz / (matrix.shape[0] * matrix.shape[1])) * 100:.2f}%")
     
     return user_item_matrix
 
 
-def save_features(user_profiles: pd.DataFrame, products: pd.DataFrame, user_item_matrix: pd.DataFrame):
+def save_user_item_matrix(user_item_matrix: UserItemMatrix, path: str = USER_ITEM_MATRIX_PATH):
+    """Save the sparse user-item matrix and its labels to one compressed .npz file."""
+    matrix = user_item_matrix.matrix
+    np.savez_compressed(
+        path,
+        data=matrix.data,
+        indices=matrix.indices,
+        indptr=matrix.indptr,
+        shape=np.array(matrix.shape),
+        user_ids=user_item_matrix.user_ids,
+        product_ids=user_item_matrix.product_ids
+    )
+
+
+def load_user_item_matrix(path: str = USER_ITEM_MATRIX_PATH) -> UserItemMatrix:
+    """Load a user-item matrix saved by save_user_item_matrix."""
+    with np.load(path) as data:
+        matrix = sparse.csr_matrix(
+            (data['data'], data['indices'], data['indptr']), shape=tuple(data['shape'])
+        )
+        return UserItemMatrix(matrix, data['user_ids'], data['product_ids'])
+
+
+def save_features(user_profiles: UserProfiles, products: pd.DataFrame, user_item_matrix: UserItemMatrix):
     """Save engineered features for ML pipeline."""
     import os
     
     os.makedirs('data/features', exist_ok=True)
     
-    user_profiles.to_csv('data/features/user_profiles.csv', index=False)
-    products.to_csv('data/features/products.csv', index=False)
-    user_item_matrix.to_csv('data/features/user_item_matrix.csv')
+    for table, path in zip(user_profiles, (USER_PROFILES_PATH, USER_CATEGORIES_PATH, USER_BRANDS_PATH)):
+        table.to_parquet(path, engine='pyarrow', compression='zstd', index=False)
+    products.to_parquet(PRODUCTS_PATH, engine='pyarrow', compression='zstd', index=False)
+    save_user_item_matrix(user_item_matrix)
     
     print("\n✓ Features saved to data/features/")
 
@@ -194,8 +347,7 @@ def run_feature_engineering(df: pd.DataFrame):
 
 if __name__ == "__main__":
     # Load cleaned data
-    df = pd.read_csv('data/cleaned_data.csv')
-    df['InvoiceDate'] = pd.to_datetime(df['InvoiceDate'])
+    df = pd.read_parquet('data/cleaned_data.parquet')
     
     # Run feature engineering
     user_profiles, products, user_item_matrix = run_feature_engineering(df)
@@ -4,10 +4,66 @@ Optimized for <500ms response time with intelligent cold-start handling.
 """
 import pandas as pd
 import numpy as np
+import pyarrow.parquet as pq
+import faiss
+import pickle
+import os
 from typing import List, Tuple, Dict, Optional
 import time
+from cachetools import LRUCache
 from ml_pipeline.collaborative_filtering import CollaborativeFilter
-from ml_pipeline.content_based_filtering import ContentBasedFilter
+from ml_pipeline.content_based_filtering import ContentBasedFilter, _top_k_indices
+from ml_pipeline.feature_engineering import (
+    PRODUCTS_PATH, USER_ITEM_MATRIX_PATH, UserItemMatrix, load_user_item_matrix
+)
+
+
+SCORE_CACHE_USERS = 10_000  # Users whose CF/CBF candidate scores are kept
+USER_NEIGHBORS_PATH = 'models/user_neighbors.pkl'
+N_USER_NEIGHBORS = 50  # Similar users whose purchases form a user's CF candidates
+TOP_POPULAR = 200  # Most popular products kept ranked for cold-start requests
+PRODUCT_COLUMNS = ['stock_code', 'description', 'category', 'price', 'popularity_score']
+
+
+def build_user_neighbors(cf_model: CollaborativeFilter, user_item_matrix: UserItemMatrix) -> np.ndarray:
+    """
+    Top-N most similar users for every user, by cosine similarity of
+    their CF user factors.
+    
+    Returns:
+        Array of shape (n_users, N_USER_NEIGHBORS) with neighbor matrix rows
+    """
+    model = cf_model.model
+    raw2inner = model.trainset._raw2inner_id_users
+    
+    # Factors per matrix row (zeros for users the model never saw)
+    factors = np.zeros((len(user_item_matrix.user_ids), model.pu.shape[1]), dtype=np.float32)
+    for row, user_id in enumerate(user_item_matrix.user_ids):
+        inner_uid = raw2inner.get(str(user_id))
+        if inner_uid is not None:
+            factors[row] = model.pu[inner_uid]
+    faiss.normalize_L2(factors)
+    
+    index = faiss.IndexFlatIP(factors.shape[1])
+    index.add(factors)
+    k = min(N_USER_NEIGHBORS + 1, len(factors))
+    _, neighbors = index.search(factors, k)
+    
+    # Drop each user from its own neighbor list
+    is_self = neighbors == np.arange(len(factors))[:, None]
+    keep = ~is_self
+    keep[~is_self.any(axis=1), -1] = False
+    return neighbors[keep].reshape(len(factors), k - 1).astype(np.int32)
+
+
+def save_user_neighbors(neighbors: np.ndarray, path: str = USER_NEIGHBORS_PATH):
+    """Save the user neighbor cache, replacing any previous file atomically."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(neighbors, f)
+    os.replace(tmp_path, path)
+    print(f"✓ User neighbors saved: {path}")
 
 
 class HybridRecommender:
@@ -35,31 +91,112 @@ class HybridRecommender:
         self.cf_model: Optional[CollaborativeFilter] = None
         self.cbf_model: Optional[ContentBasedFilter] = None
         self.products_df: Optional[pd.DataFrame] = None
-        self.user_item_matrix: Optional[pd.DataFrame] = None
+        self.products_index: Optional[pd.DataFrame] = None  # products_df by stock_code
+        self.product_ids: Optional[np.ndarray] = None  # products_df row -> stock_code
+        self.product_rows: Dict[str, int] = {}  # stock_code -> products_df row
+        self.all_products: List[str] = []  # Every stock_code, in products_df order
+        # stock_code -> (description, category, price, popularity_score)
+        self.product_details: Dict[str, Tuple[str, str, float, float]] = {}
+        self.top_popular: List[Tuple[str, float]] = []  # (stock_code, popularity 0-1), best first
+        self.user_item_matrix: Optional[UserItemMatrix] = None
+        self.user_index: Dict[str, int] = {}  # Customer ID -> matrix row
+        self.purchase_histories: Dict[str, List[str]] = {}  # Customer ID -> purchased stock codes
+        self.user_neighbors: Optional[np.ndarray] = None  # matrix row -> neighbor rows
+        # Customer ID -> {(model, n): scored candidates}
+        self._score_cache: LRUCache = LRUCache(maxsize=SCORE_CACHE_USERS)
         
     def load_models(self, 
                    cf_path: str = 'models/collaborative_filter.pkl',
                    cbf_path: str = 'models/content_based_filter.pkl',
-                   products_path: str = 'data/features/products.csv',
-                   user_item_path: str = 'data/features/user_item_matrix.csv'):
+                   products_path: str = PRODUCTS_PATH,
+                   user_item_path: str = USER_ITEM_MATRIX_PATH,
+                   neighbors_path: str = USER_NEIGHBORS_PATH):
         """Load pre-trained models and data."""
         print("Loading hybrid recommender models...")
         
         self.cf_model = CollaborativeFilter.load_model(cf_path)
         self.cbf_model = ContentBasedFilter.load_model(cbf_path)
-        self.products_df = pd.read_csv(products_path)
-        self.user_item_matrix = pd.read_csv(user_item_path, index_col=0)
+        # Only the columns recommendations use, memory-mapped, Arrow-backed
+        self.products_df = pq.read_table(
+            products_path, columns=PRODUCT_COLUMNS, memory_map=True
+        ).to_pandas(types_mapper=pd.ArrowDtype)
+        self.product_ids = self.products_df['stock_code'].to_numpy(dtype=object)
+        # Plain object index: hash lookups on it are much faster than on Arrow strings
+        self.products_index = self.products_df.drop(columns='stock_code').set_axis(
+            pd.Index(self.product_ids, name='stock_code')
+        )
+        self.product_rows = {
+            product_id: row for row, product_id in enumerate(self.product_ids)
+        }
+        self.all_products = self.product_ids.tolist()
+        self.product_details = self._build_product_details()
+        self.top_popular = self._most_popular(TOP_POPULAR)
+        self.user_item_matrix = load_user_item_matrix(user_item_path)
+        self.user_index = {
+            user_id: row for row, user_id in enumerate(self.user_item_matrix.user_ids)
+        }
+        self.purchase_histories = self._build_purchase_histories()
+        self._load_user_neighbors(neighbors_path, cf_path)
         
         print("✓ Hybrid recommender ready")
     
-    def get_user_purchase_history(self, user_id: str) -> List[str]:
-        """Get list of products user has purchased."""
-        if str(user_id) not in self.user_item_matrix.index:
-            return []
+    def _load_user_neighbors(self, path: str, cf_path: str):
+        """
+        Load the user neighbor cache written by the training pipeline.
+        A missing or stale cache is not rebuilt here; CF then scores all products.
+        """
+        n_users = len(self.user_item_matrix.user_ids)
+        if not os.path.exists(path):
+            print(f"⚠ No user neighbors at {path}; CF will score all products")
+            return
+        if os.path.getmtime(path) < os.path.getmtime(cf_path):
+            print(f"⚠ User neighbors at {path} predate the CF model; CF will score all products")
+            return
+        
+        with open(path, 'rb') as f:
+            neighbors = pickle.load(f)
+        if neighbors.shape[0] != n_users:
+            print(f"⚠ User neighbors at {path} do not match the user-item matrix; CF will score all products")
+            return
+        self.user_neighbors = neighbors
+        print(f"✓ User neighbors loaded: {path}")
+    
+    def _neighbor_candidates(self, user_id: str, all_products: List[str],
+                             min_candidates: int) -> List[str]:
+        """
+        Products purchased by a user's nearest neighbors, falling back to
+        all products when the user is unknown or the pool is too small.
+        """
+        row = self.user_index.get(str(user_id))
+        if self.user_neighbors is None or row is None:
+            return all_products
+        
+        matrix = self.user_item_matrix.matrix
+        items = np.unique(np.concatenate([
+            matrix.indices[matrix.indptr[neighbor]:matrix.indptr[neighbor + 1]]
+            for neighbor in self.user_neighbors[row]
+        ]))
+        if len(items) < min_candidates:
+            return all_products
+        return self.user_item_matrix.product_ids[items].tolist()
+    
+    def _build_purchase_histories(self) -> Dict[str, List[str]]:
+        """Purchased stock codes per customer, from the user-item matrix rows."""
+        matrix = self.user_item_matrix.matrix
+        
+        # The rows' stored cells with positive quantity are the purchases
+        keep = matrix.data > 0
+        purchased = self.user_item_matrix.product_ids[matrix.indices[keep]].tolist()
+        bounds = np.concatenate(([0], np.cumsum(keep)))[matrix.indptr]
         
-        user_row = self.user_item_matrix.loc[str(user_id)]
-        purchased = user_row[user_row > 0].index.tolist()
-        return purchased
+        return {
+            user_id: purchased[bounds[row]:bounds[row + 1]]
+            for row, user_id in enumerate(self.user_item_matrix.user_ids.tolist())
+        }
+    
+    def get_user_purchase_history(self, user_id: str) -> List[str]:
+        """Get list of products user has purchased (shared list; do not modify)."""
+        return self.purchase_histories.get(str(user_id), [])
     
     def recommend(self, user_id: str, top_k: int = 10, exclude_purchased: bool = True) -> List[Dict]:
         """
@@ -80,7 +217,7 @@ class HybridRecommender:
         num_purchases = len(purchase_history)
         
         # All available products
-        all_products = self.products_df['stock_code'].tolist()
+        all_products = self.all_products
         
         # Determine strategy based on purchase history
         if num_purchases == 0:
@@ -121,115 +258,181 @@ class HybridRecommender:
         
         return recommendations
     
+    def _cached_scores(self, user_id: str, model: str, n: int,
+                       compute) -> List[Tuple[str, float]]:
+        """
+        Model scores for a user, computed once per load_models.
+        Both models are deterministic, and purchase histories and the
+        product set are fixed once loaded.
+        """
+        entry = self._score_cache.get(str(user_id))
+        if entry is None:
+            entry = self._score_cache[str(user_id)] = {}
+        
+        scores = entry.get((model, n))
+        if scores is None:
+            scores = compute()
+            entry[(model, n)] = scores
+        return scores
+    
+    def _cbf_recommend(self, user_id: str, purchase_history: List[str],
+                       all_products: List[str], n: int) -> List[Tuple[str, float]]:
+        """Content-based scores for a user's history, cached per user."""
+        return self._cached_scores(
+            user_id, 'cbf', n,
+            lambda: self.cbf_model.recommend_for_user(purchase_history, all_products, n)
+        )
+    
+    def _cf_predict(self, user_id: str, purchase_history: List[str],
+                    all_products: List[str], n: int,
+                    neighbors_only: bool = False) -> List[Tuple[str, float]]:
+        """
+        Collaborative filtering scores for a user, cached per user.
+        With neighbors_only, only products bought by similar users are scored.
+        """
+        if neighbors_only:
+            return self._cached_scores(
+                user_id, 'cf_neighbors', n,
+                lambda: self.cf_model.predict_for_user(
+                    user_id, self._neighbor_candidates(user_id, all_products, n + len(purchase_history)), n
+                )
+            )
+        return self._cached_scores(
+            user_id, 'cf', n,
+            lambda: self.cf_model.predict_for_user(user_id, all_products, n)
+        )
+    
     def _cold_start_recommend(self, all_products: List[str], top_k: int) -> List[Dict]:
         """Recommend popular items for new users."""
-        popular = self.products_df.nlargest(top_k, 'popularity_score')
+        if top_k <= TOP_POPULAR:
+            popular = self.top_popular[:top_k]
+        else:
+            popular = self._most_popular(top_k)
         
-        recommendations = []
-        for _, row in popular.iterrows():
-            recommendations.append({
-                'product_id': row['stock_code'],
-                'score': row['popularity_score'] / 100,
+        return [
+            {
+                'product_id': product_id,
+                'score': score,
                 'source': 'popularity'
-            })
-        
-        return recommendations
+            }
+            for product_id, score in popular
+        ]
+    
+    def _most_popular(self, n: int) -> List[Tuple[str, float]]:
+        """The n most popular products as (stock_code, popularity scaled to 0-1), best first."""
+        popular = self.products_df.nlargest(n, 'popularity_score')
+        scores = popular['popularity_score'].to_numpy(dtype=np.float64) / 100
+        return list(zip(popular['stock_code'].tolist(), scores.tolist()))
     
     def _warm_start_recommend(self, user_id: str, purchase_history: List[str], 
                               all_products: List[str], top_k: int) -> List[Dict]:
         """Recommend with emphasis on content-based for users with few purchases."""
         # 70% content-based, 30% collaborative
-        cbf_recs = self.cbf_model.recommend_for_user(
-            purchase_history, all_products, top_k * 2
+        cbf_recs = self._cbf_recommend(
+            user_id, purchase_history, all_products, top_k * 2
         )
         
         try:
-            cf_recs = self.cf_model.predict_for_user(
-                user_id, all_products, top_k * 2
+            cf_recs = self._cf_predict(
+                user_id, purchase_history, all_products, top_k * 2
             )
         except:
             cf_recs = []
         
         # Combine with adjusted weights
-        combined = self._combine_scores(cbf_recs, cf_recs, cbf_weight=0.7, cf_weight=0.3)
-        return combined[:top_k]
+        return self._combine_scores(cbf_recs, cf_recs, cbf_weight=0.7, cf_weight=0.3, top_k=top_k)
     
     def _hybrid_recommend(self, user_id: str, purchase_history: List[str],
                          all_products: List[str], top_k: int) -> List[Dict]:
         """Full hybrid recommendation with configured weights."""
         # Get recommendations from both models
-        cbf_recs = self.cbf_model.recommend_for_user(
-            purchase_history, all_products, top_k * 2
+        cbf_recs = self._cbf_recommend(
+            user_id, purchase_history, all_products, top_k * 2
         )
         
-        cf_recs = self.cf_model.predict_for_user(
-            user_id, all_products, top_k * 2
+        cf_recs = self._cf_predict(
+            user_id, purchase_history, all_products, top_k * 2, neighbors_only=True
         )
         
         # Combine scores
-        combined = self._combine_scores(
+        return self._combine_scores(
             cbf_recs, cf_recs, 
             cbf_weight=self.content_weight,
-            cf_weight=self.collaborative_weight
+            cf_weight=self.collaborative_weight,
+            top_k=top_k
         )
-        
-        return combined[:top_k]
     
     def _combine_scores(self, cbf_recs: List[Tuple[str, float]], 
                        cf_recs: List[Tuple[str, float]],
-                       cbf_weight: float, cf_weight: float) -> List[Dict]:
-        """Combine scores from both models with normalization."""
-        # Normalize scores to 0-1 range
-        cbf_dict = dict(cbf_recs)
-        cf_dict = dict(cf_recs)
-        
-        # Normalize CBF scores
-        if cbf_dict:
-            max_cbf = max(cbf_dict.values())
-            cbf_dict = {k: v/max_cbf if max_cbf > 0 else v for k, v in cbf_dict.items()}
-        
-        # Normalize CF scores
-        if cf_dict:
-            max_cf = max(cf_dict.values())
-            cf_dict = {k: v/max_cf if max_cf > 0 else v for k, v in cf_dict.items()}
+                       cbf_weight: float, cf_weight: float,
+                       top_k: Optional[int] = None) -> List[Dict]:
+        """Combine scores from both models with normalization (best top_k first)."""
+        # Scatter each model's scores into product-row arrays
+        n_products = len(self.product_rows)
+        cbf_scores = np.zeros(n_products)
+        cf_scores = np.zeros(n_products)
+        candidates = np.zeros(n_products, dtype=bool)
+        
+        for recs, scores in ((cbf_recs, cbf_scores), (cf_recs, cf_scores)):
+            if not recs:
+                continue
+            product_ids, values = zip(*recs)
+            rows = np.fromiter(
+                (self.product_rows[product_id] for product_id in product_ids),
+                dtype=np.intp, count=len(recs)
+            )
+            scores[rows] = values
+            candidates[rows] = True
+            
+            # Normalize scores to 0-1 range
+            max_score = max(values)
+            if max_score > 0:
+                scores[rows] /= max_score
         
         # Combine scores
-        all_products = set(cbf_dict.keys()) | set(cf_dict.keys())
-        combined = []
+        rows = np.flatnonzero(candidates)
+        combined = cbf_weight * cbf_scores[rows] + cf_weight * cf_scores[rows]
         
-        for product_id in all_products:
-            cbf_score = cbf_dict.get(product_id, 0)
-            cf_score = cf_dict.get(product_id, 0)
-            
-            final_score = (cbf_weight * cbf_score) + (cf_weight * cf_score)
-            
-            combined.append({
+        # Top-k by final score (ties in catalog order)
+        top = _top_k_indices(combined, len(combined) if top_k is None else top_k)
+        rows = rows[top]
+        
+        return [
+            {
                 'product_id': product_id,
-                'score': final_score,
+                'score': score,
                 'cbf_score': cbf_score,
                 'cf_score': cf_score
-            })
-        
-        # Sort by final score
-        combined.sort(key=lambda x: x['score'], reverse=True)
-        return combined
+            }
+            for product_id, score, cbf_score, cf_score in zip(
+                self.product_ids[rows],
+                combined[top].tolist(),
+                cbf_scores[rows].tolist(),
+                cf_scores[rows].tolist()
+            )
+        ]
+    
+    def _build_product_details(self) -> Dict[str, Tuple[str, str, float, float]]:
+        """Display fields per product with a description, for enrichment."""
+        products = self.products_df[self.products_df['description'].notna()]
+        return dict(zip(
+            products['stock_code'].to_numpy(dtype=object).tolist(),
+            zip(
+                products['description'].to_numpy(dtype=object).tolist(),
+                products['category'].to_numpy(dtype=object).tolist(),
+                products['price'].to_numpy(dtype=np.float64).tolist(),
+                products['popularity_score'].to_numpy(dtype=np.float64).tolist()
+            )
+        ))
     
     def _enrich_recommendations(self, recommendations: List[Dict]) -> List[Dict]:
         """Add product details to recommendations."""
         enriched = []
         
         for rec in recommendations:
-            product_id = rec['product_id']
-            product_info = self.products_df[
-                self.products_df['stock_code'] == product_id
-            ]
-            
-            if not product_info.empty:
-                product_info = product_info.iloc[0]
-                rec['product_name'] = product_info['description']
-                rec['category'] = product_info['category']
-                rec['price'] = float(product_info['price'])
-                rec['popularity'] = float(product_info['popularity_score'])
+            details = self.product_details.get(rec['product_id'])
+            if details is not None:
+                rec['product_name'], rec['category'], rec['price'], rec['popularity'] = details
                 enriched.append(rec)
         
         return enriched
@@ -250,9 +453,7 @@ class HybridRecommender:
         num_purchases = len(purchase_history)
         
         # Get categories
-        purchased_products = self.products_df[
-            self.products_df['stock_code'].isin(purchase_history)
-        ]
+        purchased_products = self.products_index.reindex(purchase_history).dropna(how='all')
         
         top_categories = purchased_products['category'].value_counts().head(3).index.tolist()
         avg_price = purchased_products['price'].mean()
@@ -279,10 +480,8 @@ if __name__ == "__main__":
     recommender.load_models()
     
     # Test with different user scenarios
-    user_item_matrix = pd.read_csv('data/features/user_item_matrix.csv', index_col=0)
-    
     # Test 1: Existing user with many purchases
-    test_user_1 = user_item_matrix.index[0]
+    test_user_1 = recommender.user_item_matrix.user_ids[0]
     print(f"\n{'='*60}")
     print(f"Test 1: User with purchase history ({test_user_1})")
     print(f"{'='*60}")
@@ -14,6 +14,7 @@ from ml_pipeline.feature_engineering import run_feature_engineering
 from ml_pipeline.collaborative_filtering import CollaborativeFilter
 from ml_pipeline.content_based_filtering import ContentBasedFilter
 from ml_pipeline.embedding_generator import EmbeddingGenerator
+from ml_pipeline.hybrid_engine import build_user_neighbors, save_user_neighbors
 import pandas as pd
 
 
@@ -36,7 +37,7 @@ def run_complete_pipeline():
     # Step 2: Feature Engineering
     print("STEP 2/5: Feature Engineering")
     user_profiles, products, user_item_matrix = run_feature_engineering(df)
-    print(f"✓ Created {len(user_profiles):,} user profiles")
+    print(f"✓ Created {len(user_profiles.profiles):,} user profiles")
     print(f"✓ Created {len(products):,} product profiles\n")
     
     # Step 3: Train Collaborative Filtering
@@ -44,6 +45,8 @@ def run_complete_pipeline():
     cf_model = CollaborativeFilter(n_factors=50, n_epochs=20)
     cf_model.train(user_item_matrix)
     cf_model.save_model()
+    # Saved after the CF model, so the hybrid engine sees it as current
+    save_user_neighbors(build_user_neighbors(cf_model, user_item_matrix))
     print()
     
     # Step 4: Train Content-Based Filtering
@@ -76,7 +79,7 @@ def run_complete_pipeline():
     print(f"  Transactions processed: {stats['final_records']:,}")
     print(f"  Unique customers: {stats['unique_customers']:,}")
     print(f"  Unique products: {stats['unique_products']:,}")
-    print(f"  User profiles created: {len(user_profiles):,}")
+    print(f"  User profiles created: {len(user_profiles.profiles):,}")
     print(f"  Product embeddings: {len(products):,}")
     print(f"  Models trained: 3 (Collaborative, Content-Based, Embeddings)")
     print("\n" + "="*70 + "\n")
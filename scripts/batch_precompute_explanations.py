@@ -0,0 +1,191 @@
+"""
+Script to precompute recommendation explanations with the Groq Batch API.
+Run nightly after data is loaded into MongoDB.
+
+Explains every (user segment, product) pair for the most common segments
+and their most popular products in a single asynchronous batch job, then
+stores the results in the precomputed_explanations collection, which the
+recommendation service checks before calling the LLM.
+"""
+import asyncio
+import orjson
+import time
+import sys
+import os
+from groq import AsyncGroq
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from backend.config import get_settings
+from backend.services.prompts import SYSTEM_PROMPT, format_segment_explanation_prompt
+
+settings = get_settings()
+
+TOP_SEGMENTS = 50  # Most common (category, price sensitivity) segments
+PRODUCTS_PER_SEGMENT = 20  # Popular products in the segment's category
+GLOBAL_PRODUCTS = 20  # Globally popular products explained for every segment
+POLL_INTERVAL_SECONDS = 30
+TERMINAL_STATUSES = {'completed', 'failed', 'expired', 'cancelled'}
+
+PRODUCT_PROJECTION = {'_id': 0, 'stock_code': 1, 'description': 1, 'category': 1, 'price': 1}
+
+
+def to_product(doc: dict) -> dict:
+    """Map a product document to the recommendation dict shape."""
+    return {
+        'product_id': doc['stock_code'],
+        'product_name': doc['description'],
+        'category': doc['category'],
+        'price': doc['price']
+    }
+
+
+async def get_segments(db) -> list:
+    """Most common user segments as 'category|price_sensitivity' keys."""
+    pipeline = [
+        {'$match': {'top_categories.0': {'$exists': True}}},
+        {'$group': {
+            '_id': {
+                'category': {'$arrayElemAt': ['$top_categories', 0]},
+                'price_sensitivity': '$price_sensitivity'
+            },
+            'users': {'$sum': 1}
+        }},
+        {'$sort': {'users': -1}},
+        {'$limit': TOP_SEGMENTS}
+    ]
+    groups = await db.user_profiles.aggregate(pipeline).to_list(length=None)
+    return [f"{g['_id']['category']}|{g['_id']['price_sensitivity']}" for g in groups]
+
+
+async def get_segment_products(db, segments: list) -> dict:
+    """Products to explain for each segment (category top-N plus global top-N)."""
+    global_products = await db.products.find(
+        {}, projection=PRODUCT_PROJECTION
+    ).sort('popularity_score', -1).limit(GLOBAL_PRODUCTS).to_list(length=GLOBAL_PRODUCTS)
+
+    categories = sorted({segment.rsplit('|', 1)[0] for segment in segments})
+    category_results = await asyncio.gather(*[
+        db.products.find({'category': category}, projection=PRODUCT_PROJECTION)
+        .sort('popularity_score', -1).limit(PRODUCTS_PER_SEGMENT)
+        .to_list(length=PRODUCTS_PER_SEGMENT)
+        for category in categories
+    ])
+    by_category = dict(zip(categories, category_results))
+
+    segment_products = {}
+    for segment in segments:
+        products = {}
+        for doc in by_category[segment.rsplit('|', 1)[0]] + global_products:
+            products.setdefault(doc['stock_code'], to_product(doc))
+        segment_products[segment] = list(products.values())
+    return segment_products
+
+
+def build_batch_file(segment_products: dict) -> bytes:
+    """One chat-completion request per (segment, product), as JSONL."""
+    lines = []
+    for segment, products in segment_products.items():
+        for product in products:
+            lines.append(orjson.dumps({
+                'custom_id': f"{segment}|{product['product_id']}",
+                'method': 'POST',
+                'url': '/v1/chat/completions',
+                'body': {
+                    'model': settings.LLM_MODEL,
+                    'messages': [
+                        {'role': 'system', 'content': SYSTEM_PROMPT},
+                        {'role': 'user', 'content': format_segment_explanation_prompt(segment, product)}
+                    ],
+                    'max_tokens': settings.LLM_MAX_TOKENS,
+                    'temperature': settings.LLM_TEMPERATURE
+                }
+            }))
+    return b"\n".join(lines)
+
+
+async def precompute_explanations():
+    """Run the batch job and store its explanations in MongoDB."""
+    print("\n" + "="*60)
+    print("PRECOMPUTING EXPLANATIONS (GROQ BATCH)")
+    print("="*60 + "\n")
+
+    if not settings.GROQ_API_KEY:
+        print("❌ Error: GROQ_API_KEY is not configured")
+        return
+
+    client = AsyncIOMotorClient(settings.MONGODB_URL)
+    db = client[settings.DATABASE_NAME]
+    groq = AsyncGroq(api_key=settings.GROQ_API_KEY)
+
+    try:
+        segments = await get_segments(db)
+        if not segments:
+            print("❌ Error: No user profiles found. Run scripts/load_data_to_mongo.py first")
+            return
+
+        segment_products = await get_segment_products(db, segments)
+        batch_file = build_batch_file(segment_products)
+        request_count = sum(len(products) for products in segment_products.values())
+        print(f"✓ {len(segments)} segments, {request_count:,} explanation requests")
+
+        # Submit batch
+        uploaded = await groq.files.create(
+            file=('explanations.jsonl', batch_file), purpose='batch'
+        )
+        batch = await groq.batches.create(
+            completion_window='24h',
+            endpoint='/v1/chat/completions',
+            input_file_id=uploaded.id
+        )
+        print(f"✓ Submitted batch {batch.id}")
+
+        # Wait for completion
+        while batch.status not in TERMINAL_STATUSES:
+            await asyncio.sleep(POLL_INTERVAL_SECONDS)
+            batch = await groq.batches.retrieve(batch.id)
+            print(f"  Status: {batch.status}")
+
+        if batch.status != 'completed' or not batch.output_file_id:
+            print(f"❌ Error: Batch ended with status '{batch.status}'")
+            return
+
+        # Store results
+        output = await groq.files.content(batch.output_file_id)
+        now = time.time()
+        operations = []
+        for line in (await output.read()).splitlines():
+            if not line.strip():
+                continue
+            result = orjson.loads(line)
+            response = result.get('response') or {}
+            if result.get('error') or response.get('status_code') != 200:
+                continue
+
+            segment, product_id = result['custom_id'].rsplit('|', 1)
+            explanation = response['body']['choices'][0]['message']['content'].strip()
+            operations.append(UpdateOne(
+                {'segment': segment, 'product_id': product_id},
+                {'$set': {'explanation': explanation, 'updated_at': now}},
+                upsert=True
+            ))
+
+        await db.precomputed_explanations.create_index(
+            [('segment', 1), ('product_id', 1)], unique=True
+        )
+        if operations:
+            await db.precomputed_explanations.bulk_write(operations, ordered=False)
+        print(f"✓ Stored {len(operations):,} explanations")
+
+    finally:
+        await groq.close()
+        client.close()
+
+    print("\n" + "="*60 + "\n")
+
+
+if __name__ == "__main__":
+    asyncio.run(precompute_explanations())
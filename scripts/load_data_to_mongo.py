@@ -4,8 +4,9 @@ Run after training pipeline completes.
 """
 import asyncio
 import pandas as pd
+import pyarrow.parquet as pq
 from motor.motor_asyncio import AsyncIOMotorClient
-from datetime import datetime
+import time
 import sys
 import os
 
@@ -13,9 +14,56 @@ import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from backend.config import get_settings
+from ml_pipeline.data_ingestion import CLEANED_DATA_PATH
+from ml_pipeline.feature_engineering import (
+    USER_PROFILES_PATH, USER_CATEGORIES_PATH, USER_BRANDS_PATH, PRODUCTS_PATH
+)
 
 settings = get_settings()
 
+TRANSACTION_BATCH_SIZE = 20_000
+INSERT_CONCURRENCY = 4  # insert_many calls in flight at once
+TRANSACTION_COLUMNS = ['Customer ID', 'StockCode', 'Quantity', 'Price', 'InvoiceDate', 'Country']
+
+
+async def insert_transactions(db, cleaned_data: pq.ParquetFile,
+                              user_id_map: dict, product_id_map: dict) -> int:
+    """
+    Stream transactions from the cleaned Parquet file into MongoDB in large
+    unordered batches, several in flight while the next batch is read.
+    """
+    semaphore = asyncio.Semaphore(INSERT_CONCURRENCY)
+    total_inserted = 0
+    
+    async def insert_batch(transactions_data: list):
+        nonlocal total_inserted
+        try:
+            await db.transactions.insert_many(transactions_data, ordered=False)
+        finally:
+            semaphore.release()
+        total_inserted += len(transactions_data)
+        print(f"  Progress: {total_inserted:,} transactions inserted...")
+    
+    tasks = []
+    for batch in cleaned_data.iter_batches(batch_size=TRANSACTION_BATCH_SIZE, columns=TRANSACTION_COLUMNS):
+        df = batch.to_pandas()
+        transactions_data = pd.DataFrame({
+            'user_id': df['Customer ID'].astype(str).map(user_id_map),
+            'product_id': df['StockCode'].astype(str).map(product_id_map),
+            'quantity': df['Quantity'].astype(int),
+            'unit_price': df['Price'].astype(float),
+            'invoice_date': df['InvoiceDate'],
+            'country': df['Country'].astype(str)
+        }).dropna(subset=['user_id', 'product_id']).to_dict('records')
+        
+        if transactions_data:
+            # Wait for a free slot before reading further ahead
+            await semaphore.acquire()
+            tasks.append(asyncio.create_task(insert_batch(transactions_data)))
+    
+    await asyncio.gather(*tasks)
+    return total_inserted
+
 
 async def load_data_to_mongo():
     """Load all processed data into MongoDB."""
@@ -31,13 +79,15 @@ async def load_data_to_mongo():
     print("Loading data files...")
     
     try:
-        df = pd.read_csv('data/cleaned_data.csv')
-        df['InvoiceDate'] = pd.to_datetime(df['InvoiceDate'])
+        cleaned_data = pq.ParquetFile(CLEANED_DATA_PATH)
+        customer_ids = pq.read_table(CLEANED_DATA_PATH, columns=['Customer ID']).column(0).to_pandas()
         
-        user_profiles = pd.read_csv('data/features/user_profiles.csv')
-        products = pd.read_csv('data/features/products.csv')
+        user_profiles = pd.read_parquet(USER_PROFILES_PATH)
+        user_categories = pd.read_parquet(USER_CATEGORIES_PATH)
+        user_brands = pd.read_parquet(USER_BRANDS_PATH)
+        products = pd.read_parquet(PRODUCTS_PATH)
         
-        print(f"✓ Loaded {len(df):,} transactions")
+        print(f"✓ Found {cleaned_data.metadata.num_rows:,} transactions")
         print(f"✓ Loaded {len(user_profiles):,} user profiles")
         print(f"✓ Loaded {len(products):,} products")
         
@@ -54,14 +104,17 @@ async def load_data_to_mongo():
     await db.user_profiles.delete_many({})
     print("✓ Collections cleared")
     
+    # Timestamps are epoch seconds; one value for the whole load
+    now = time.time()
+    
     # Insert users
     print("\nInserting users...")
-    unique_customers = df['Customer ID'].unique()
+    unique_customers = customer_ids.unique()
     users_data = [
         {
             'customer_id': str(cid),
-            'created_at': datetime.utcnow(),
-            'updated_at': datetime.utcnow()
+            'created_at': now,
+            'updated_at': now
         }
         for cid in unique_customers
     ]
@@ -74,16 +127,14 @@ async def load_data_to_mongo():
     
     # Insert products
     print("Inserting products...")
-    products_data = []
-    for _, row in products.iterrows():
-        products_data.append({
-            'stock_code': str(row['stock_code']),
-            'description': str(row['description']),
-            'category': str(row['category']),
-            'price': float(row['price']),
-            'popularity_score': float(row['popularity_score']),
-            'created_at': datetime.utcnow()
-        })
+    products_data = pd.DataFrame({
+        'stock_code': products['stock_code'].astype(str),
+        'description': products['description'].astype(str),
+        'category': products['category'].astype(str),
+        'price': products['price'].astype(float),
+        'popularity_score': products['popularity_score'].astype(float),
+        'created_at': now
+    }).to_dict('records')
     
     result = await db.products.insert_many(products_data)
     product_id_map = {
@@ -92,56 +143,42 @@ async def load_data_to_mongo():
     }
     print(f"✓ Inserted {len(products_data):,} products")
     
-    # Insert transactions (in batches for performance)
+    # Insert transactions (streamed in batches for performance)
     print("Inserting transactions...")
-    batch_size = 1000
-    total_inserted = 0
-    
-    for i in range(0, len(df), batch_size):
-        batch = df.iloc[i:i+batch_size]
-        transactions_data = []
-        
-        for _, row in batch.iterrows():
-            customer_id = str(row['Customer ID'])
-            stock_code = str(row['StockCode'])
-            
-            if customer_id in user_id_map and stock_code in product_id_map:
-                transactions_data.append({
-                    'user_id': user_id_map[customer_id],
-                    'product_id': product_id_map[stock_code],
-                    'quantity': int(row['Quantity']),
-                    'unit_price': float(row['Price']),
-                    'invoice_date': row['InvoiceDate'],
-                    'country': str(row['Country'])
-                })
-        
-        if transactions_data:
-            await db.transactions.insert_many(transactions_data)
-            total_inserted += len(transactions_data)
-        
-        if (i + batch_size) % 10000 == 0:
-            print(f"  Progress: {total_inserted:,} transactions inserted...")
+    total_inserted = await insert_transactions(db, cleaned_data, user_id_map, product_id_map)
     
     print(f"✓ Inserted {total_inserted:,} transactions")
     
     # Insert user profiles
     print("Inserting user profiles...")
-    profiles_data = []
     
-    for _, row in user_profiles.iterrows():
-        customer_id = str(row['customer_id'])
-        
-        if customer_id in user_id_map:
-            profiles_data.append({
-                'user_id': user_id_map[customer_id],
-                'total_spend': float(row['total_spend']),
-                'avg_order_value': float(row['avg_order_value']),
-                'purchase_frequency': float(row['purchase_frequency']),
-                'top_categories': eval(row['top_categories']) if isinstance(row['top_categories'], str) else [],
-                'brand_affinity': eval(row['brand_affinity']) if isinstance(row['brand_affinity'], str) else {},
-                'price_sensitivity': str(row['price_sensitivity']),
-                'updated_at': datetime.utcnow()
-            })
+    # Fold the tall category/brand tables back into per-customer list and dict
+    top_categories = {}
+    for customer_id, category in zip(user_categories['customer_id'], user_categories['category']):
+        top_categories.setdefault(customer_id, []).append(category)
+    brand_affinity = {}
+    for customer_id, brand, affinity in zip(
+        user_brands['customer_id'], user_brands['brand'], user_brands['affinity']
+    ):
+        brand_affinity.setdefault(customer_id, {})[brand] = float(affinity)
+    
+    user_profiles = user_profiles.assign(
+        user_id=user_profiles['customer_id'].astype(str).map(user_id_map)
+    ).dropna(subset=['user_id'])
+    profiles_data = pd.DataFrame({
+        'user_id': user_profiles['user_id'],
+        'total_spend': user_profiles['total_spend'].astype(float),
+        'avg_order_value': user_profiles['avg_order_value'].astype(float),
+        'purchase_frequency': user_profiles['purchase_frequency'].astype(float),
+        'top_categories': [
+            top_categories.get(customer_id, []) for customer_id in user_profiles['customer_id']
+        ],
+        'brand_affinity': [
+            brand_affinity.get(customer_id, {}) for customer_id in user_profiles['customer_id']
+        ],
+        'price_sensitivity': user_profiles['price_sensitivity'].astype(str),
+        'updated_at': now
+    }).to_dict('records')
     
     if profiles_data:
         await db.user_profiles.insert_many(profiles_data)
@@ -155,6 +192,8 @@ async def load_data_to_mongo():
     await db.products.create_index('stock_code', unique=True)
     await db.products.create_index('category')
     await db.products.create_index('price')
+    await db.products.create_index([('category', 1), ('popularity_score', -1)])
+    await db.products.create_index([('popularity_score', -1)])
     await db.user_profiles.create_index('user_id', unique=True)
     print("✓ Indexes created")
     